@@ -6,38 +6,15 @@ import imageIO.png
 # this function reads an RGB color png file and returns width, height, as well as pixel arrays for r,g,b
 def readRGBImageToSeparatePixelArrays(input_filename):
     image_reader = imageIO.png.Reader(filename=input_filename)
-    # png reader gives us width and height, as well as RGB data in image_rows (a list of rows of RGB triplets)
-    (image_width, image_height, rgb_image_rows, rgb_image_info) = image_reader.read()
+    # png reader gives us width and height, as well as one flat array of values per colour channel (r, g, b)
+    (image_width, image_height, rgb_planes, rgb_image_info) = image_reader.read_planes()
 
     print("read image width={}, height={}".format(image_width, image_height))
 
     # our pixel arrays are lists of lists, where each inner list stores one row of greyscale pixels
-    pixel_array_r = []
-    pixel_array_g = []
-    pixel_array_b = []
-
-    for row in rgb_image_rows:
-        pixel_row_r = []
-        pixel_row_g = []
-        pixel_row_b = []
-        r = 0
-        g = 0
-        b = 0
-        for elem in range(len(row)):
-            # RGB triplets are stored consecutively in image_rows
-            if elem % 3 == 0:
-                r = row[elem]
-            elif elem % 3 == 1:
-                g = row[elem]
-            else:
-                b = row[elem]
-                pixel_row_r.append(r)
-                pixel_row_g.append(g)
-                pixel_row_b.append(b)
-
-        pixel_array_r.append(pixel_row_r)
-        pixel_array_g.append(pixel_row_g)
-        pixel_array_b.append(pixel_row_b)
+    (pixel_array_r, pixel_array_g, pixel_array_b) = [
+        [plane[row * image_width:(row + 1) * image_width].tolist() for row in range(image_height)]
+        for plane in rgb_planes[:3]]
 
     return (image_width, image_height, pixel_array_r, pixel_array_g, pixel_array_b)
 
@@ -1,4 +1,5 @@
 import math
+import operator
 import sys
 from pathlib import Path
 
@@ -12,42 +13,34 @@ import imageIO.png
 def readRGBImageToSeparatePixelArrays(input_filename):
 
     image_reader = imageIO.png.Reader(filename=input_filename)
-    # png reader gives us width and height, as well as RGB data in image_rows (a list of rows of RGB triplets)
-    (image_width, image_height, rgb_image_rows, rgb_image_info) = image_reader.read()
+    # png reader gives us width and height, as well as one flat array of values per colour channel (r, g, b)
+    (image_width, image_height, rgb_planes, rgb_image_info) = image_reader.read_planes()
 
     print("read image width={}, height={}".format(image_width, image_height))
 
     # our pixel arrays are lists of lists, where each inner list stores one row of greyscale pixels
-    pixel_array_r = []
-    pixel_array_g = []
-    pixel_array_b = []
-
-    for row in rgb_image_rows:
-        pixel_row_r = []
-        pixel_row_g = []
-        pixel_row_b = []
-        r = 0
-        g = 0
-        b = 0
-        for elem in range(len(row)):
-            # RGB triplets are stored consecutively in image_rows
-            if elem % 3 == 0:
-                r = row[elem]
-            elif elem % 3 == 1:
-                g = row[elem]
-            else:
-                b = row[elem]
-                pixel_row_r.append(r)
-                pixel_row_g.append(g)
-                pixel_row_b.append(b)
-
-        pixel_array_r.append(pixel_row_r)
-        pixel_array_g.append(pixel_row_g)
-        pixel_array_b.append(pixel_row_b)
+    (pixel_array_r, pixel_array_g, pixel_array_b) = [
+        [plane[row * image_width:(row + 1) * image_width].tolist() for row in range(image_height)]
+        for plane in rgb_planes[:3]]
 
     return (image_width, image_height, pixel_array_r, pixel_array_g, pixel_array_b)
 
 
+# this function reads an RGB color png file and returns width, height, as well as a single greyscale pixel array
+# each row is converted with the same weights as computeRGBToGreyscale while the png file is decoded
+def readRGBImageToGreyscalePixelArray(input_filename):
+
+    image_reader = imageIO.png.Reader(filename=input_filename)
+    # png reader gives us width and height, as well as one flat array of greyscale (luma) values
+    (image_width, image_height, greyscale_plane, greyscale_image_info) = image_reader.read_luma()
+
+    print("read image width={}, height={}".format(image_width, image_height))
+
+    pixel_array = [greyscale_plane[row * image_width:(row + 1) * image_width].tolist() for row in range(image_height)]
+
+    return (image_width, image_height, pixel_array)
+
+
 # a useful shortcut method to create a list of lists based array representation for an image, initialized with a value
 def createInitializedGreyscalePixelArray(image_width, image_height, initValue = 0):
 
@@ -86,6 +79,113 @@ def standard(new_list):
         result = i - value
         var += result ** 2
     return (var / len(new_list)) ** 0.5
+
+# this function builds summed-area tables of a pixel array and of its squares, so that the sum of any window can be
+# read from four entries; with a stride s, the entry at [row + s][col + s] holds the sum of the pixels at
+# (row - s * i, col - s * j) for all i, j >= 0, which sums every s-th pixel only, as the sparse windows of
+# computeStandardDeviationImage5x5 do (stride 2), whereas stride 1 gives the usual tables for dense windows
+def computeSummedAreaTables(pixel_array, image_width, image_height, stride = 1):
+    sums = [[0] * (image_width + stride) for row in range(image_height + stride)]
+    squares = [[0] * (image_width + stride) for row in range(image_height + stride)]
+    for row in range(image_height):
+        pixel_row = pixel_array[row]
+        sums_above = sums[row]
+        squares_above = squares[row]
+        sums_row = sums[row + stride]
+        squares_row = squares[row + stride]
+        for col in range(image_width):
+            value = pixel_row[col]
+            sums_row[col + stride] = value + sums_row[col] + sums_above[col + stride] - sums_above[col]
+            squares_row[col + stride] = value * value + squares_row[col] + squares_above[col + stride] - squares_above[col]
+    return (sums, squares)
+
+# the size of the windows of the standard deviation image in detectLicensePlate, and the distance between the pixels
+# of a window that are sampled: 3 and 2 sample the same 9 pixels of a 5x5 neighbourhood as
+# computeStandardDeviationImage5x5, whereas for example 5 and 1 would use all 25 pixels
+STANDARD_DEVIATION_WINDOW_SIZE = 3
+STANDARD_DEVIATION_STRIDE = 2
+
+# this function computes the standard deviation of a window_size x window_size window around each pixel, sampling
+# every stride-th pixel, from the summed-area tables; the cost per pixel does not depend on the window size
+# pixels closer to the border than the window reaches are set to 0, as in computeStandardDeviationImage5x5
+def computeWindowedStandardDeviation(pixel_array, image_width, image_height, window_size = 5, stride = 1):
+    (sums, squares) = computeSummedAreaTables(pixel_array, image_width, image_height, stride)
+    return computeWindowedStandardDeviationFromTables(sums, squares, image_width, image_height, window_size, stride)
+
+# the same, from summed-area tables that computeSummedAreaTables built with the same stride, so that the tables can be
+# shared by several window sizes
+def computeWindowedStandardDeviationFromTables(sums, squares, image_width, image_height, window_size, stride):
+    if window_size < 1 or window_size % 2 == 0 or stride < 1:
+        raise ValueError("the window size must be odd and the stride positive")
+    out_pixel = createInitializedGreyscalePixelArray(image_width, image_height, 0.0)
+    reach = stride * (window_size // 2)
+    count = window_size * window_size
+    for row in range(reach, image_height - reach):
+        sums_top = sums[row - reach]
+        sums_bottom = sums[row + reach + stride]
+        squares_top = squares[row - reach]
+        squares_bottom = squares[row + reach + stride]
+        out_row = out_pixel[row]
+        for col in range(reach, image_width - reach):
+            left = col - reach
+            right = col + reach + stride
+            total = sums_bottom[right] - sums_top[right] - sums_bottom[left] + sums_top[left]
+            total_squares = squares_bottom[right] - squares_top[right] - squares_bottom[left] + squares_top[left]
+            # the sums are exact integers, so count * count * variance can be computed without cancellation
+            out_row[col] = math.sqrt(count * total_squares - total * total) / count
+    return out_pixel
+
+# the mean of the same windows, for callers that want it as well as the standard deviation; the pipeline only needs the
+# standard deviation, so it does not pay for this image
+def computeWindowedMeanFromTables(sums, image_width, image_height, window_size, stride):
+    if window_size < 1 or window_size % 2 == 0 or stride < 1:
+        raise ValueError("the window size must be odd and the stride positive")
+    mean_pixel = createInitializedGreyscalePixelArray(image_width, image_height, 0.0)
+    reach = stride * (window_size // 2)
+    count = window_size * window_size
+    for row in range(reach, image_height - reach):
+        sums_top = sums[row - reach]
+        sums_bottom = sums[row + reach + stride]
+        mean_row = mean_pixel[row]
+        for col in range(reach, image_width - reach):
+            left = col - reach
+            right = col + reach + stride
+            mean_row[col] = (sums_bottom[right] - sums_top[right] - sums_bottom[left] + sums_top[left]) / count
+    return mean_pixel
+
+# the mean and the standard deviation images, from one pair of summed-area tables
+def computeWindowedMeanAndStandardDeviation(pixel_array, image_width, image_height, window_size = 5, stride = 1):
+    (sums, squares) = computeSummedAreaTables(pixel_array, image_width, image_height, stride)
+    mean_pixel = computeWindowedMeanFromTables(sums, image_width, image_height, window_size, stride)
+    out_pixel = computeWindowedStandardDeviationFromTables(sums, squares, image_width, image_height, window_size, stride)
+    return (mean_pixel, out_pixel)
+
+# this function computes a standard deviation image for each of the given window sizes (for example [3, 5, 9, 15], so
+# that plates of different sizes all respond) from one pair of summed-area tables; it returns the list of images, or
+# with combine="max" their pixelwise maximum, or with combine="weighted" their pixelwise sum weighted by weights (by
+# default all the same, which gives the mean of the images)
+def computeMultiScaleStandardDeviation(pixel_array, image_width, image_height, window_sizes, stride = 1, combine = None, weights = None):
+    if combine not in (None, "max", "weighted"):
+        raise ValueError("unknown way to combine the standard deviation images {}".format(combine))
+    if len(window_sizes) == 0:
+        raise ValueError("there must be at least one window size")
+    if weights is None:
+        weights = [1.0 / len(window_sizes)] * len(window_sizes)
+    if len(weights) != len(window_sizes):
+        raise ValueError("there must be one weight for each window size")
+    (sums, squares) = computeSummedAreaTables(pixel_array, image_width, image_height, stride)
+    out_pixels = [computeWindowedStandardDeviationFromTables(sums, squares, image_width, image_height, window_size, stride)
+                  for window_size in window_sizes]
+    if combine is None:
+        return out_pixels
+    combined = createInitializedGreyscalePixelArray(image_width, image_height, 0.0)
+    for row in range(image_height):
+        rows = [out_pixel[row] for out_pixel in out_pixels]
+        if combine == "max":
+            combined[row] = [max(values) for values in zip(*rows)]
+        else:
+            combined[row] = [sum(weight * value for (weight, value) in zip(weights, values)) for values in zip(*rows)]
+    return combined
 def computeMinAndMaxValues(pixel_array, image_width, image_height):
     min1 = pixel_array[0][0]
     max1 = pixel_array[0][0]
@@ -153,6 +253,51 @@ def computeDilation8Nbh3x3FlatSE(pixel_array, image_width, image_height):
             if max(new_list) >0:
                 list[i][j] = 1
     return list
+
+# this function computes the maximum (or, with extremum=min, the minimum) of each window of 2 * radius + 1 values of a
+# row, centered on each value, with zeros outside the row, using the van Herk/Gil-Werman algorithm: the padded row is
+# cut into blocks as long as a window, and each window is covered by the end of one block and the start of the next,
+# so that with the running extremum of each block from the left and from the right, every window costs three
+# comparisons whatever its size
+def computeRunningExtremum(row_values, radius, extremum = max):
+    window = 2 * radius + 1
+    padded = [0] * radius + list(row_values) + [0] * radius
+    padded += [0] * (-len(padded) % window)
+    from_left = padded[:]
+    from_right = padded[:]
+    for i in range(1, len(padded)):
+        if i % window != 0:
+            from_left[i] = extremum(from_left[i - 1], padded[i])
+    for i in range(len(padded) - 2, -1, -1):
+        if (i + 1) % window != 0:
+            from_right[i] = extremum(from_right[i + 1], padded[i])
+    return [extremum(from_right[i], from_left[i + window - 1]) for i in range(len(row_values))]
+
+# a (2 * radius + 1) x (2 * radius + 1) square is the same as a row followed by a column, so these dilate and erode
+# with a square structuring element by running extrema along the rows, and then along the columns of the transposed
+# array; like the 3x3 functions above, they take any pixel above 0 as set, count pixels outside the image as 0, and
+# return an image of 0 and 1 values, so that computeDilation with radius 3 gives the same image as
+# computeDilation8Nbh3x3FlatSE applied three times, whether the input is 0 and 1 or 0 and 255
+def computeBinaryPixelArray(pixel_array):
+    return [[1 if pixel > 0 else 0 for pixel in pixel_row] for pixel_row in pixel_array]
+
+def computeDilation(pixel_array, image_width, image_height, radius):
+    rows = [computeRunningExtremum(pixel_row, radius, max) for pixel_row in computeBinaryPixelArray(pixel_array)]
+    columns = [computeRunningExtremum(column, radius, max) for column in zip(*rows)]
+    return [list(pixel_row) for pixel_row in zip(*columns)]
+
+def computeErosion(pixel_array, image_width, image_height, radius):
+    rows = [computeRunningExtremum(pixel_row, radius, min) for pixel_row in computeBinaryPixelArray(pixel_array)]
+    columns = [computeRunningExtremum(column, radius, min) for column in zip(*rows)]
+    return [list(pixel_row) for pixel_row in zip(*columns)]
+
+# the closing (a dilation followed by an erosion) in one go: the column passes of the dilation and of the erosion are
+# both done on the transposed array, so that it is transposed only twice, rather than four times; it returns 0 and 1
+# values, as computeDilation and computeErosion do
+def computeClosing(pixel_array, image_width, image_height, radius):
+    rows = [computeRunningExtremum(pixel_row, radius, max) for pixel_row in computeBinaryPixelArray(pixel_array)]
+    columns = [computeRunningExtremum(computeRunningExtremum(column, radius, max), radius, min) for column in zip(*rows)]
+    return [computeRunningExtremum(pixel_row, radius, min) for pixel_row in zip(*columns)]
 class Queue:
     def __init__(self):
         self.items = []
@@ -207,61 +352,66 @@ def computeConnectedComponentLabeling(pixel_array, image_width, image_height):
                             dic[label] += 1
 
     return (pixel_array, dic)
-# This is our code skeleton that performs the license plate detection.
-# Feel free to try it on your own images of cars, but keep in mind that with our algorithm developed in this lecture,
-# we won't detect arbitrary or difficult to detect license plates!
-def main():
-
-    command_line_arguments = sys.argv[1:]
-
-    SHOW_DEBUG_FIGURES = True
-
-    # this is the default input image filename
-    input_filename = "numberplate1.png"
-
-    if command_line_arguments != []:
-        input_filename = command_line_arguments[0]
-        SHOW_DEBUG_FIGURES = False
-
-    output_path = Path("output_images")
-    if not output_path.exists():
-        # create output directory
-        output_path.mkdir(parents=True, exist_ok=True)
-
-    output_filename = output_path / Path(input_filename.replace(".png", "_output.png"))
-    if len(command_line_arguments) == 2:
-        output_filename = Path(command_line_arguments[1])
-
-
-    # we read in the png file, and receive three pixel arrays for red, green and blue components, respectively
-    # each pixel array contains 8 bit integer values between 0 and 255 encoding the color values
-    (image_width, image_height, px_array_r, px_array_g, px_array_b) = readRGBImageToSeparatePixelArrays(input_filename)
-
-    # setup the plots for intermediate results in a figure
-    fig1, axs1 = pyplot.subplots(2, 2)
-    axs1[0, 0].set_title('Input red channel of image')
-    axs1[0, 0].imshow(px_array_r, cmap='gray')
-    axs1[0, 1].set_title('Input green channel of image')
-    axs1[0, 1].imshow(px_array_g, cmap='gray')
-    axs1[1, 0].set_title('Input blue channel of image')
-    axs1[1, 0].imshow(px_array_b, cmap='gray')
-
-
-    # STUDENT IMPLEMENTATION here
-    px_array = computeRGBToGreyscale(px_array_r, px_array_g, px_array_b, image_width, image_height)
-    px_array = computeStandardDeviationImage5x5(px_array, image_width, image_height)
-    px_array = scaleTo0And255AndQuantize(px_array, image_width, image_height)
-    px_array = computeThresholdGE(px_array, 150, image_width, image_height)
-    px_array = computeDilation8Nbh3x3FlatSE(px_array, image_width, image_height)
-    px_array = computeDilation8Nbh3x3FlatSE(px_array, image_width, image_height)
-    px_array = computeDilation8Nbh3x3FlatSE(px_array, image_width, image_height)
-
-
-    px_array = computeErosion8Nbh3x3FlatSE(px_array, image_width, image_height)
-    px_array = computeErosion8Nbh3x3FlatSE(px_array, image_width, image_height)
-    px_array = computeErosion8Nbh3x3FlatSE(px_array, image_width, image_height)
-    px_array, d = computeConnectedComponentLabeling(px_array, image_width, image_height)
 
+# this function labels the 4-connected components of an image given as runs of non-zero pixels: run i covers columns
+# run_starts[i] to run_ends[i] - 1 of row run_rows[i], and the runs are in raster order; runs that touch a run in the
+# row above are joined with a union-find structure, and the components are numbered in the order in which their first
+# pixel is met, as in computeConnectedComponentLabeling; it returns the label of each run, and the number of pixels
+# with each label
+def computeRunLabels(run_rows, run_starts, run_ends):
+    parent = list(range(len(run_rows)))
+
+    def find(run):
+        while parent[run] != run:
+            parent[run] = parent[parent[run]]
+            run = parent[run]
+        return run
+
+    # the runs of the previous row and of the current row are both in order of their start, so the overlapping pairs
+    # are found by walking along both at once
+    previous_first = previous_last = 0
+    run = 0
+    while run < len(run_rows):
+        row = run_rows[run]
+        last = run
+        while last < len(run_rows) and run_rows[last] == row:
+            last += 1
+        if previous_last > previous_first and run_rows[previous_first] == row - 1:
+            above = previous_first
+            for current in range(run, last):
+                while above < previous_last and run_ends[above] <= run_starts[current]:
+                    above += 1
+                other = above
+                while other < previous_last and run_starts[other] < run_ends[current]:
+                    (root_a, root_b) = (find(other), find(current))
+                    if root_a != root_b:
+                        # the root is always the run that comes first, so that it holds the first pixel
+                        parent[max(root_a, root_b)] = min(root_a, root_b)
+                    other += 1
+        (previous_first, previous_last) = (run, last)
+        run = last
+
+    run_labels = []
+    dic = {}
+    root_labels = {}
+    for run in range(len(run_rows)):
+        root = find(run)
+        if root not in root_labels:
+            root_labels[root] = len(root_labels) + 1
+            dic[root_labels[root]] = 0
+        label = root_labels[root]
+        run_labels.append(label)
+        dic[label] += run_ends[run] - run_starts[run]
+    return (run_labels, dic)
+
+# this function finds the bounding box of the license plate among the connected components of a labeled pixel array,
+# where component_sizes maps each label to its number of pixels; it returns (min_x, min_y, max_x, max_y), all zero if
+# no component has the shape of a license plate
+def computeLicensePlateBoundingBox(px_array, component_sizes, image_width, image_height):
+
+    bbox_min_x = bbox_min_y = bbox_max_x = bbox_max_y = 0
+
+    d = component_sizes
     for index in d.keys():
         list_x=[]
         list_y=[]
@@ -298,7 +448,543 @@ def main():
                     bbox_max_x = box_max_x
                     bbox_min_y = box_min_y
                     bbox_max_y = box_max_y
-    px_array = computeRGBToGreyscale(px_array_r, px_array_g, px_array_b, image_width, image_height)
+
+
+    return (bbox_min_x, bbox_min_y, bbox_max_x, bbox_max_y)
+
+
+# numpy is optional: when it is available the pipeline stages can also run on numpy arrays (see PIPELINE_BACKEND),
+# the list based functions above remain the reference implementation; the binary images below use it, if it is
+# there, to convert to and from pixel arrays faster
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# the backend used by detectLicensePlate: "lists" for the list based functions, "numpy" for the *Numpy functions
+# below, or "bits" for the list based functions up to the threshold and the *Binary functions after it; it can be
+# changed at runtime with setPipelineBackend, or with the --backend=numpy (or bits) command line option
+PIPELINE_BACKEND = "lists"
+
+
+def setPipelineBackend(backend):
+    global PIPELINE_BACKEND
+    if backend not in ("lists", "numpy", "bits"):
+        raise ValueError("unknown pipeline backend {}".format(backend))
+    if backend == "numpy" and numpy is None:
+        raise ValueError("the numpy pipeline backend needs numpy to be installed")
+    PIPELINE_BACKEND = backend
+
+
+# each of the following functions takes the same arguments as the list based function of the same name (without
+# Numpy), computes the same values, and returns a numpy array; the pixel arrays can be lists of lists or numpy arrays,
+# and a numpy array can be indexed as px_array[i][j] just like a list of lists
+
+def computeRGBToGreyscaleNumpy(pixel_array_r, pixel_array_g, pixel_array_b, image_width, image_height):
+
+    greyscale = 0.299 * numpy.asarray(pixel_array_r) + 0.587 * numpy.asarray(pixel_array_g) + 0.114 * numpy.asarray(pixel_array_b)
+    # numpy.round rounds halves to even, as round does
+    return numpy.round(greyscale).astype(numpy.int64)
+
+
+def computeStandardDeviationImage5x5Numpy(pixel_array, image_width, image_height):
+
+    pixels = numpy.asarray(pixel_array, dtype=numpy.int64)
+    out_pixel = numpy.zeros((image_height, image_width))
+    if image_height < 5 or image_width < 5:
+        return out_pixel
+    # the nine samples of each window, in the order that computeStandardDeviationImage5x5 lists them, as views of the
+    # pixel array offset by -2, 0 or +2 rows and columns
+    offsets = [(-2, -2), (-2, 0), (-2, 2), (2, -2), (2, 0), (2, 2), (0, -2), (0, 0), (0, 2)]
+    samples = [pixels[2 + dy:image_height - 2 + dy, 2 + dx:image_width - 2 + dx] for (dy, dx) in offsets]
+    # the same arithmetic as standard, in the same order; the results can still differ in the last bit, because ** on
+    # Python floats calls the C library's pow, whereas numpy multiplies and takes square roots, but once the values are
+    # scaled and quantized by scaleTo0And255AndQuantize they are the same
+    mean = sum(samples) / len(samples)
+    variance = numpy.zeros_like(mean)
+    for sample in samples:
+        variance += (sample - mean) ** 2
+    out_pixel[2:image_height - 2, 2:image_width - 2] = (variance / len(samples)) ** 0.5
+    return out_pixel
+
+
+def computeSummedAreaTablesNumpy(pixel_array, image_width, image_height, stride=1):
+
+    pixels = numpy.asarray(pixel_array, dtype=numpy.int64)
+    sums = numpy.zeros((image_height + stride, image_width + stride), dtype=numpy.int64)
+    squares = numpy.zeros((image_height + stride, image_width + stride), dtype=numpy.int64)
+    # the pixels that are a multiple of stride apart form stride x stride interleaved grids, each of which is summed
+    # on its own
+    for row_offset in range(stride):
+        for col_offset in range(stride):
+            grid = pixels[row_offset::stride, col_offset::stride]
+            sums[stride + row_offset::stride, stride + col_offset::stride] = grid.cumsum(0).cumsum(1)
+            squares[stride + row_offset::stride, stride + col_offset::stride] = (grid * grid).cumsum(0).cumsum(1)
+    return (sums, squares)
+
+
+def computeWindowedStandardDeviationNumpy(pixel_array, image_width, image_height, window_size=5, stride=1):
+
+    (sums, squares) = computeSummedAreaTablesNumpy(pixel_array, image_width, image_height, stride)
+    return computeWindowedStandardDeviationFromTablesNumpy(sums, squares, image_width, image_height, window_size, stride)
+
+
+# the sums of the window_size x window_size windows of a summed-area table, for the pixels that the windows fit around
+def computeWindowSumsNumpy(table, image_width, image_height, window_size, stride):
+
+    if window_size < 1 or window_size % 2 == 0 or stride < 1:
+        raise ValueError("the window size must be odd and the stride positive")
+    reach = stride * (window_size // 2)
+    top = slice(0, max(0, image_height - 2 * reach))
+    bottom = slice(2 * reach + stride, image_height + stride)
+    left = slice(0, max(0, image_width - 2 * reach))
+    right = slice(2 * reach + stride, image_width + stride)
+    return table[bottom, right] - table[top, right] - table[bottom, left] + table[top, left]
+
+
+def computeWindowedStandardDeviationFromTablesNumpy(sums, squares, image_width, image_height, window_size, stride):
+
+    out_pixel = numpy.zeros((image_height, image_width))
+    total = computeWindowSumsNumpy(sums, image_width, image_height, window_size, stride)
+    if total.size == 0:
+        return out_pixel
+    total_squares = computeWindowSumsNumpy(squares, image_width, image_height, window_size, stride)
+    reach = stride * (window_size // 2)
+    count = window_size * window_size
+    # numpy.sqrt is correctly rounded like math.sqrt, so these are exactly the values of the list based function
+    out_pixel[reach:image_height - reach, reach:image_width - reach] = numpy.sqrt(count * total_squares - total * total) / count
+    return out_pixel
+
+
+def computeWindowedMeanFromTablesNumpy(sums, image_width, image_height, window_size, stride):
+
+    mean_pixel = numpy.zeros((image_height, image_width))
+    total = computeWindowSumsNumpy(sums, image_width, image_height, window_size, stride)
+    if total.size == 0:
+        return mean_pixel
+    reach = stride * (window_size // 2)
+    mean_pixel[reach:image_height - reach, reach:image_width - reach] = total / (window_size * window_size)
+    return mean_pixel
+
+
+def computeWindowedMeanAndStandardDeviationNumpy(pixel_array, image_width, image_height, window_size=5, stride=1):
+
+    (sums, squares) = computeSummedAreaTablesNumpy(pixel_array, image_width, image_height, stride)
+    mean_pixel = computeWindowedMeanFromTablesNumpy(sums, image_width, image_height, window_size, stride)
+    out_pixel = computeWindowedStandardDeviationFromTablesNumpy(sums, squares, image_width, image_height, window_size, stride)
+    return (mean_pixel, out_pixel)
+
+
+def computeMultiScaleStandardDeviationNumpy(pixel_array, image_width, image_height, window_sizes, stride=1, combine=None, weights=None):
+
+    if combine not in (None, "max", "weighted"):
+        raise ValueError("unknown way to combine the standard deviation images {}".format(combine))
+    if len(window_sizes) == 0:
+        raise ValueError("there must be at least one window size")
+    if weights is None:
+        weights = [1.0 / len(window_sizes)] * len(window_sizes)
+    if len(weights) != len(window_sizes):
+        raise ValueError("there must be one weight for each window size")
+    (sums, squares) = computeSummedAreaTablesNumpy(pixel_array, image_width, image_height, stride)
+    out_pixels = [computeWindowedStandardDeviationFromTablesNumpy(sums, squares, image_width, image_height, window_size, stride)
+                  for window_size in window_sizes]
+    if combine is None:
+        return out_pixels
+    if combine == "max":
+        return numpy.maximum.reduce(out_pixels)
+    # summed in the same order as the list based function, so that the results are the same
+    combined = numpy.zeros((image_height, image_width))
+    for (weight, out_pixel) in zip(weights, out_pixels):
+        combined += weight * out_pixel
+    return combined
+
+
+def computeMinAndMaxValuesNumpy(pixel_array, image_width, image_height):
+
+    pixels = numpy.asarray(pixel_array)
+    return (pixels.min(), pixels.max())
+
+
+def computeThresholdGENumpy(pixel_array, thresholded, image_width, image_height):
+
+    # like computeThresholdGE, the threshold is 150, and pixels at or above it become 255
+    return numpy.where(numpy.asarray(pixel_array) < 150, 0, 255)
+
+
+def scaleTo0And255AndQuantizeNumpy(pixel_array, image_width, image_height):
+
+    pixels = numpy.asarray(pixel_array)
+    (min_value, max_value) = computeMinAndMaxValuesNumpy(pixels, image_width, image_height)
+    if min_value == max_value:
+        return numpy.zeros((image_height, image_width), dtype=numpy.int64)
+    return numpy.round((pixels - min_value) / (max_value - min_value) * 255).astype(numpy.int64)
+
+
+# the 3x3 neighbourhoods of every pixel, with zero padding outside the image, as nine views of a padded copy
+def neighbourhoods3x3Numpy(pixel_array, image_width, image_height):
+
+    padded = numpy.zeros((image_height + 2, image_width + 2), dtype=bool)
+    padded[1:-1, 1:-1] = numpy.asarray(pixel_array) > 0
+    return [padded[dy:dy + image_height, dx:dx + image_width] for dy in range(3) for dx in range(3)]
+
+
+def computeErosion8Nbh3x3FlatSENumpy(pixel_array, image_width, image_height):
+
+    return numpy.logical_and.reduce(neighbourhoods3x3Numpy(pixel_array, image_width, image_height)).astype(numpy.uint8)
+
+
+def computeDilation8Nbh3x3FlatSENumpy(pixel_array, image_width, image_height):
+
+    return numpy.logical_or.reduce(neighbourhoods3x3Numpy(pixel_array, image_width, image_height)).astype(numpy.uint8)
+
+
+# computeRunningExtremum for every row of a numpy array at once, with extremum numpy.maximum or numpy.minimum: the
+# running extrema of the blocks are accumulated along the last axis of a (rows, blocks, window) view
+def computeRunningExtremumNumpy(pixel_array, radius, extremum):
+
+    (height, width) = pixel_array.shape
+    window = 2 * radius + 1
+    padded_width = width + 2 * radius
+    padded_width += -padded_width % window
+    padded = numpy.zeros((height, padded_width), dtype=pixel_array.dtype)
+    padded[:, radius:radius + width] = pixel_array
+    blocks = padded.reshape(height, padded_width // window, window)
+    from_left = extremum.accumulate(blocks, axis=2).reshape(height, padded_width)
+    from_right = extremum.accumulate(blocks[:, :, ::-1], axis=2)[:, :, ::-1].reshape(height, padded_width)
+    return extremum(from_right[:, :width], from_left[:, window - 1:window - 1 + width])
+
+
+# computeDilation, computeErosion and computeClosing with numpy: any pixel above 0 is set, and the result is a uint8
+# array of 0 and 1 values, as from computeDilation8Nbh3x3FlatSENumpy
+def computeDilationNumpy(pixel_array, image_width, image_height, radius):
+
+    pixels = (numpy.asarray(pixel_array) > 0).astype(numpy.uint8)
+    rows = computeRunningExtremumNumpy(pixels, radius, numpy.maximum)
+    return computeRunningExtremumNumpy(rows.T, radius, numpy.maximum).T
+
+
+def computeErosionNumpy(pixel_array, image_width, image_height, radius):
+
+    pixels = (numpy.asarray(pixel_array) > 0).astype(numpy.uint8)
+    rows = computeRunningExtremumNumpy(pixels, radius, numpy.minimum)
+    return computeRunningExtremumNumpy(rows.T, radius, numpy.minimum).T
+
+
+def computeClosingNumpy(pixel_array, image_width, image_height, radius):
+
+    pixels = (numpy.asarray(pixel_array) > 0).astype(numpy.uint8)
+    rows = computeRunningExtremumNumpy(pixels, radius, numpy.maximum)
+    columns = computeRunningExtremumNumpy(rows.T, radius, numpy.maximum)
+    columns = computeRunningExtremumNumpy(columns, radius, numpy.minimum)
+    return computeRunningExtremumNumpy(columns.T, radius, numpy.minimum)
+
+
+# this labels the 4-connected components with the same labels as computeConnectedComponentLabeling (numbered in the
+# order in which their first pixel is met, row by row), but works on runs of non-zero pixels rather than on single
+# pixels: the runs of each row are found with numpy, and runs that touch a run in the row above are joined with a
+# union-find structure (see computeRunLabels)
+def computeConnectedComponentLabelingNumpy(pixel_array, image_width, image_height):
+
+    pixels = numpy.asarray(pixel_array) != 0
+    padded = numpy.zeros((image_height, image_width + 2), dtype=numpy.int8)
+    padded[:, 1:-1] = pixels
+    steps = numpy.diff(padded, axis=1)
+    (run_rows, run_starts) = numpy.nonzero(steps == 1)
+    (_, run_ends) = numpy.nonzero(steps == -1)
+    run_rows = run_rows.tolist()
+    run_starts = run_starts.tolist()
+    run_ends = run_ends.tolist()
+
+    (run_labels, dic) = computeRunLabels(run_rows, run_starts, run_ends)
+    labels = numpy.zeros((image_height, image_width), dtype=numpy.int64)
+    for run in range(len(run_rows)):
+        labels[run_rows[run], run_starts[run]:run_ends[run]] = run_labels[run]
+    return (labels, dic)
+
+
+def computeLicensePlateBoundingBoxNumpy(px_array, component_sizes, image_width, image_height):
+
+    bbox_min_x = bbox_min_y = bbox_max_x = bbox_max_y = 0
+
+    labels = numpy.asarray(px_array)
+    (ys, xs) = numpy.nonzero(labels)
+    # group the pixels by label, keeping each group in raster order as computeLicensePlateBoundingBox visits them
+    order = numpy.argsort(labels[ys, xs], kind="stable")
+    (ys, xs) = (ys[order], xs[order])
+    group_labels = labels[ys, xs]
+    starts = numpy.searchsorted(group_labels, sorted(component_sizes))
+    ends = numpy.searchsorted(group_labels, sorted(component_sizes), side="right")
+    for (index, start, end) in zip(sorted(component_sizes), starts, ends):
+        if component_sizes[index] > 0 and end > start:
+            group_x = xs[start:end]
+            group_y = ys[start:end]
+            squared = group_x.astype(numpy.int64) ** 2 + group_y.astype(numpy.int64) ** 2
+            # argmin and argmax pick the first of equal values, as the strict comparisons in the list version do
+            min = int(numpy.argmin(squared))
+            max = int(numpy.argmax(squared))
+
+            box_min_x = int(group_x[min])
+            box_min_y = int(group_y[min])
+
+            box_max_x = int(group_x[max])
+            box_max_y = int(group_y[max])
+
+            box_width = box_max_x - box_min_x
+            box_height = box_max_y - box_min_y
+
+            if box_width > 0 and box_height>0:
+                if box_width/box_height > 1.5 and box_width/box_height < 6.0:
+                    bbox_min_x = box_min_x
+                    bbox_max_x = box_max_x
+                    bbox_min_y = box_min_y
+                    bbox_max_y = box_max_y
+
+    return (bbox_min_x, bbox_min_y, bbox_max_x, bbox_max_y)
+
+
+# after thresholding, the pipeline only needs to know which pixels are set, so the following functions work on binary
+# images that store each row as the bits of a Python int: bit x of a row holds the pixel in column x, a row of an 800
+# pixel wide mask takes 13 machine words instead of 800 list cells, and shifting, or-ing and and-ing whole rows
+# processes 64 pixels per operation
+class BinaryImage:
+    def __init__(self, width, height, rows=None):
+        self.width = width
+        self.height = height
+        # the bits of a row that lie inside the image
+        self.mask = (1 << width) - 1
+        self.rows = [0] * height if rows is None else rows
+
+    def getPixel(self, x, y):
+        return (self.rows[y] >> x) & 1
+
+    def countPixels(self):
+        return sum(bin(row).count("1") for row in self.rows)
+
+
+# this function thresholds a pixel array straight into a binary image, like computeThresholdGE, where the pixels at or
+# above the threshold are set; with numpy the rows are packed by numpy.packbits, and otherwise each row is written as a
+# string of binary digits, last column first, which int reads in one go
+def computeThresholdGEBinary(pixel_array, threshold, image_width, image_height):
+
+    if numpy is not None:
+        packed = numpy.packbits(numpy.asarray(pixel_array) >= threshold, axis=1, bitorder="little")
+        rows = [int.from_bytes(packed_row.tobytes(), "little") for packed_row in packed]
+    else:
+        rows = [int("0" + "".join(["1" if value >= threshold else "0" for value in reversed(pixel_row)]), 2)
+                for pixel_row in pixel_array]
+    return BinaryImage(image_width, image_height, rows)
+
+
+# this function converts a pixel array to a binary image in which the non-zero pixels are set
+def createBinaryImageFromPixelArray(pixel_array, image_width, image_height):
+
+    return computeThresholdGEBinary(pixel_array, 1, image_width, image_height)
+
+
+# this function converts a binary image back to a list of lists pixel array, with set pixels equal to value and the
+# others 0
+def createPixelArrayFromBinaryImage(binary_image, value=1):
+
+    width = binary_image.width
+    if numpy is not None:
+        row_bytes = (width + 7) // 8
+        packed = numpy.frombuffer(b"".join(row.to_bytes(row_bytes, "little") for row in binary_image.rows),
+                                  dtype=numpy.uint8).reshape(binary_image.height, row_bytes)
+        bits = numpy.unpackbits(packed, axis=1, count=width, bitorder="little")
+        return (bits * value).tolist()
+    row_format = "0{}b".format(width)
+    return [[value if bit == "1" else 0 for bit in reversed(format(row, row_format))] for row in binary_image.rows]
+
+
+# these dilate and erode each row on its own by radius columns, with zeros outside the row: shifting a row by a
+# number of columns and or-ing (and-ing) it with itself widens (narrows) the runs of set pixels by that many columns,
+# so the shifts double in size and only about log2(radius) of them are needed
+def computeRowDilationBinary(row, radius, mask):
+
+    covered = 0
+    while covered < radius:
+        shift = min(covered + 1, radius - covered)
+        row = (row | (row << shift) | (row >> shift)) & mask
+        covered += shift
+    return row
+
+
+def computeRowErosionBinary(row, radius, mask):
+
+    covered = 0
+    while covered < radius:
+        shift = min(covered + 1, radius - covered)
+        row = row & (row << shift) & (row >> shift) & mask
+        covered += shift
+    return row
+
+
+# the columns are dilated (eroded) by the running or (and) of the rows, with computeRunningExtremum, whose zero padding
+# outside the image is what computeDilation and computeErosion use as well; so on the same image these give the same
+# pixels as computeDilation, computeErosion and computeClosing with the same radius
+def computeDilationBinary(binary_image, radius):
+
+    rows = [computeRowDilationBinary(row, radius, binary_image.mask) for row in binary_image.rows]
+    return BinaryImage(binary_image.width, binary_image.height, computeRunningExtremum(rows, radius, operator.or_))
+
+
+def computeErosionBinary(binary_image, radius):
+
+    rows = computeRunningExtremum(binary_image.rows, radius, operator.and_)
+    rows = [computeRowErosionBinary(row, radius, binary_image.mask) for row in rows]
+    return BinaryImage(binary_image.width, binary_image.height, rows)
+
+
+def computeClosingBinary(binary_image, radius):
+
+    rows = [computeRowDilationBinary(row, radius, binary_image.mask) for row in binary_image.rows]
+    rows = computeRunningExtremum(computeRunningExtremum(rows, radius, operator.or_), radius, operator.and_)
+    rows = [computeRowErosionBinary(row, radius, binary_image.mask) for row in rows]
+    return BinaryImage(binary_image.width, binary_image.height, rows)
+
+
+# this function labels the 4-connected components of a binary image like computeConnectedComponentLabeling, and
+# returns a list of lists pixel array of labels together with the number of pixels with each label; the runs of set
+# pixels are read from the bits where a row differs from itself shifted by one column, which are the starts and the
+# ends of the runs, in turn
+def computeConnectedComponentLabelingBinary(binary_image):
+
+    run_rows = []
+    run_starts = []
+    run_ends = []
+    for (row_index, row) in enumerate(binary_image.rows):
+        steps = row ^ (row << 1)
+        is_start = True
+        while steps:
+            lowest = steps & -steps
+            column = lowest.bit_length() - 1
+            steps ^= lowest
+            if is_start:
+                run_rows.append(row_index)
+                run_starts.append(column)
+            else:
+                run_ends.append(column)
+            is_start = not is_start
+
+    (run_labels, dic) = computeRunLabels(run_rows, run_starts, run_ends)
+    labels = createInitializedGreyscalePixelArray(binary_image.width, binary_image.height)
+    for run in range(len(run_rows)):
+        labels[run_rows[run]][run_starts[run]:run_ends[run]] = [run_labels[run]] * (run_ends[run] - run_starts[run])
+    return (labels, dic)
+
+
+# this function runs the detection pipeline on a greyscale pixel array, and returns the bounding box of the
+# license plate as (min_x, min_y, max_x, max_y); the box is empty (all zero) if no plate is found
+# backend selects the implementation of the stages ("lists", "numpy" or "bits"), by default PIPELINE_BACKEND
+def detectLicensePlate(px_array_greyscale, image_width, image_height, backend=None):
+
+    if backend is None:
+        backend = PIPELINE_BACKEND
+
+    if backend == "numpy":
+        px_array = numpy.asarray(px_array_greyscale)
+        px_array = computeWindowedStandardDeviationNumpy(
+            px_array, image_width, image_height, STANDARD_DEVIATION_WINDOW_SIZE, STANDARD_DEVIATION_STRIDE)
+        px_array = scaleTo0And255AndQuantizeNumpy(px_array, image_width, image_height)
+        px_array = computeThresholdGENumpy(px_array, 150, image_width, image_height)
+        px_array = computeClosingNumpy(px_array, image_width, image_height, 3)
+        px_array, d = computeConnectedComponentLabelingNumpy(px_array, image_width, image_height)
+        return computeLicensePlateBoundingBoxNumpy(px_array, d, image_width, image_height)
+
+    px_array = px_array_greyscale
+    px_array = computeWindowedStandardDeviation(
+        px_array, image_width, image_height, STANDARD_DEVIATION_WINDOW_SIZE, STANDARD_DEVIATION_STRIDE)
+    px_array = scaleTo0And255AndQuantize(px_array, image_width, image_height)
+
+    if backend == "bits":
+        binary_image = computeThresholdGEBinary(px_array, 150, image_width, image_height)
+        binary_image = computeClosingBinary(binary_image, 3)
+        px_array, d = computeConnectedComponentLabelingBinary(binary_image)
+        return computeLicensePlateBoundingBox(px_array, d, image_width, image_height)
+
+    px_array = computeThresholdGE(px_array, 150, image_width, image_height)
+    # three 3x3 dilations followed by three 3x3 erosions are a 7x7 closing
+    px_array = computeClosing(px_array, image_width, image_height, 3)
+    px_array, d = computeConnectedComponentLabeling(px_array, image_width, image_height)
+
+    return computeLicensePlateBoundingBox(px_array, d, image_width, image_height)
+
+
+# this function consumes a stream of concatenated png files (for example frames that a camera pushes into a pipe),
+# and prints the bounding box detected in each frame, without writing any files
+def detectLicensePlatesInStream(input_stream):
+
+    for (frame, (image_width, image_height, greyscale_plane, greyscale_image_info)) in enumerate(
+            imageIO.png.iter_stream(input_stream, mode='luma')):
+        px_array_greyscale = [greyscale_plane[row * image_width:(row + 1) * image_width].tolist() for row in range(image_height)]
+        (bbox_min_x, bbox_min_y, bbox_max_x, bbox_max_y) = detectLicensePlate(px_array_greyscale, image_width, image_height)
+        print("frame {}: width={}, height={}, bbox=({}, {}, {}, {})".format(
+            frame, image_width, image_height, bbox_min_x, bbox_min_y, bbox_max_x, bbox_max_y))
+        sys.stdout.flush()
+
+
+# This is our code skeleton that performs the license plate detection.
+# Feel free to try it on your own images of cars, but keep in mind that with our algorithm developed in this lecture,
+# we won't detect arbitrary or difficult to detect license plates!
+def main():
+
+    command_line_arguments = sys.argv[1:]
+
+    # options can be given before the file names: --backend=numpy runs the pipeline on numpy arrays, and
+    # --backend=bits runs the stages after the threshold on binary images with one bit per pixel
+    # (test_pipeline_backends.py checks that all the backends detect the same bounding boxes)
+    while command_line_arguments != [] and command_line_arguments[0].startswith("--"):
+        option = command_line_arguments.pop(0)
+        if option.startswith("--backend="):
+            setPipelineBackend(option[len("--backend="):])
+        else:
+            sys.exit("unknown option {}".format(option))
+
+    SHOW_DEBUG_FIGURES = True
+
+    # this is the default input image filename
+    input_filename = "numberplate1.png"
+
+    if command_line_arguments != []:
+        input_filename = command_line_arguments[0]
+        SHOW_DEBUG_FIGURES = False
+
+    # "-" as the input filename reads a stream of png files from stdin, one frame after another
+    if input_filename == "-":
+        detectLicensePlatesInStream(imageIO.png.binary_stdin())
+        return
+
+    output_path = Path("output_images")
+    if not output_path.exists():
+        # create output directory
+        output_path.mkdir(parents=True, exist_ok=True)
+
+    output_filename = output_path / Path(input_filename.replace(".png", "_output.png"))
+    if len(command_line_arguments) == 2:
+        output_filename = Path(command_line_arguments[1])
+
+
+    # we read in the png file, and receive a single greyscale pixel array, which is all the detection needs
+    # the pixel array contains 8 bit integer values between 0 and 255
+    (image_width, image_height, px_array_greyscale) = readRGBImageToGreyscalePixelArray(input_filename)
+
+    # setup the plots for intermediate results in a figure
+    fig1, axs1 = pyplot.subplots(2, 2)
+    if SHOW_DEBUG_FIGURES:
+        # the three pixel arrays for red, green and blue components are only needed for the debug figures
+        (image_width, image_height, px_array_r, px_array_g, px_array_b) = readRGBImageToSeparatePixelArrays(input_filename)
+        axs1[0, 0].set_title('Input red channel of image')
+        axs1[0, 0].imshow(px_array_r, cmap='gray')
+        axs1[0, 1].set_title('Input green channel of image')
+        axs1[0, 1].imshow(px_array_g, cmap='gray')
+        axs1[1, 0].set_title('Input blue channel of image')
+        axs1[1, 0].imshow(px_array_b, cmap='gray')
+
+
+    # STUDENT IMPLEMENTATION here
+    (bbox_min_x, bbox_min_y, bbox_max_x, bbox_max_y) = detectLicensePlate(px_array_greyscale, image_width, image_height)
+
+    px_array = px_array_greyscale
     axs1[1, 1].set_title('Final image of detection')
     axs1[1, 1].imshow(px_array, cmap='gray')
     rect = Rectangle((bbox_min_x, bbox_min_y), bbox_max_x - bbox_min_x, bbox_max_y - bbox_min_y, linewidth=1,
@@ -173,23 +173,38 @@ from __future__ import print_function
 
 __version__ = "0.0.20"
 
+import asyncio
 import collections
+import concurrent.futures
 import io   # For io.BytesIO
 import itertools
 import math
+import mmap
+import os
 # http://www.python.org/doc/2.4.4/lib/module-operator.html
 import operator
+import queue
 import re
 import struct
 import sys
+import threading
 # http://www.python.org/doc/2.4.4/lib/module-warnings.html
 import warnings
 import zlib
 
 from array import array
 
+# numpy is optional; when it is importable some of the
+# per-byte and per-value loops are done with whole-row operations.
+# The pure Python code is always available and is the reference.
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
-__all__ = ['Image', 'Reader', 'Writer', 'write_chunks', 'from_array']
+
+__all__ = ['Image', 'Reader', 'Writer', 'write_chunks', 'from_array',
+           'probe', 'RowBuffers', 'async_read', 'async_read_all', 'iter_stream']
 
 
 # The PNG signature.
@@ -227,6 +242,20 @@ def adam7_generate(width, height):
 # Models the 'pHYs' chunk (used by the Reader)
 Resolution = collections.namedtuple('_Resolution', 'x y unit_is_meter')
 
+# Models the 'IHDR' chunk (returned by probe)
+Header = collections.namedtuple(
+    '_Header', 'width height bitdepth color_type interlace')
+
+
+# For each bit depth less than 8, a table that maps
+# each byte to the bytes of the values that are packed into it
+# (used to unpack rows with a single ``join``).
+unpack_tables = dict(
+    (bitdepth, [bytes((byte >> shift) & (2 ** bitdepth - 1)
+                      for shift in range(8 - bitdepth, -1, -bitdepth))
+                for byte in range(256)])
+    for bitdepth in (1, 2, 4))
+
 
 def group(s, n):
     return list(zip(* [iter(s)] * n))
@@ -347,6 +376,13 @@ class ChunkError(FormatError):
     pass
 
 
+class LimitError(FormatError):
+    """
+    The PNG file is larger than the limits
+    given to the :class:`Reader` allow.
+    """
+
+
 class Default:
     """The default for the greyscale paramter."""
 
@@ -373,7 +409,11 @@ class Writer:
                  chunk_limit=2**20,
                  x_pixels_per_unit=None,
                  y_pixels_per_unit=None,
-                 unit_is_meter=False):
+                 unit_is_meter=False,
+                 workers=None,
+                 filter_type=None,
+                 strategy=None,
+                 preset=None):
         """
         Create a PNG encoder object.
 
@@ -404,6 +444,14 @@ class Writer:
           Create an interlaced image.
         chunk_limit
           Write multiple ``IDAT`` chunks to save memory.
+        workers
+          Compress with this many threads.
+        filter_type
+          Scanline filter: 0 to 4, or ``'adaptive'``.
+        strategy
+          zlib compression strategy.
+        preset
+          Defaults for `compression`, `filter_type`, and `strategy`.
         x_pixels_per_unit
           Number of pixels a unit along the x axis (write a
           `pHYs` chunk).
@@ -522,8 +570,58 @@ class Writer:
         compressing the image.
         In order to avoid using large amounts of memory,
         multiple ``IDAT`` chunks may be created.
+
+        If `workers` is greater than 1 then
+        the filtered image data is split into strips
+        (of at most :data:`STRIP_BYTES` bytes, and
+        at most `chunk_limit` bytes)
+        that are compressed concurrently, on that many threads;
+        see :func:`compress_strips`.
+        Each strip is written as one ``IDAT`` chunk.
+
+        `filter_type` selects the filter applied to each scanline
+        before it is compressed:
+        0 (the default) is *None*,
+        1 *Sub*, 2 *Up*, 3 *Average*, 4 *Paeth*;
+        ``'adaptive'`` chooses a filter for each scanline,
+        the one whose output has
+        the least sum of absolute values (as signed bytes).
+        Filters are restarted at the beginning of each reduced pass
+        of an interlaced image.
+        Filtering usually makes photographic images much smaller,
+        but not images with a bit depth of less than 8,
+        or colour mapped images.
+
+        `strategy` is passed to ``zlib.compressobj``;
+        for example ``zlib.Z_FILTERED`` or ``zlib.Z_RLE``.
+
+        `preset` is a key of :data:`compression_presets`,
+        ``'mask'`` for binary (or few valued) images,
+        ``'photo'`` for photographic ones;
+        it supplies whichever of
+        `compression`, `filter_type`, and `strategy`
+        are not given.
         """
 
+        if preset is not None:
+            if preset not in compression_presets:
+                raise ProtocolError(
+                    "preset must be one of %s, not %r"
+                    % (', '.join(sorted(compression_presets)), preset))
+            defaults = compression_presets[preset]
+            if compression is None:
+                compression = defaults['compression']
+            if filter_type is None:
+                filter_type = defaults['filter_type']
+            if strategy is None:
+                strategy = defaults['strategy']
+        if filter_type is None:
+            filter_type = 0
+        if filter_type not in (0, 1, 2, 3, 4, 'adaptive'):
+            raise ProtocolError(
+                "filter_type must be 0 to 4 or 'adaptive', not %r"
+                % (filter_type,))
+
         # At the moment the `planes` argument is ignored;
         # its purpose is to act as a dummy so that
         # ``Writer(x, y, **info)`` works, where `info` is a dictionary
@@ -605,6 +703,9 @@ class Writer:
         self.bitdepth = int(bitdepth)
         self.compression = compression
         self.chunk_limit = chunk_limit
+        self.workers = workers
+        self.filter_type = filter_type
+        self.strategy = strategy
         self.interlace = bool(interlace)
         self.palette = palette
         self.x_pixels_per_unit = x_pixels_per_unit
@@ -664,7 +765,9 @@ class Writer:
 
         if self.interlace:
             fmt = 'BH'[self.bitdepth > 8]
-            a = array(fmt, itertools.chain(*check_rows(rows)))
+            a = array(fmt)
+            for row in check_rows(rows):
+                a.extend(row_array(fmt, row))
             return self.write_array(outfile, a)
 
         nrows = self.write_passes(outfile, check_rows(rows))
@@ -725,37 +828,91 @@ class Writer:
 
         # http://www.w3.org/TR/PNG/#11IDAT
         if self.compression is not None:
-            compressor = zlib.compressobj(self.compression)
+            level = self.compression
         else:
-            compressor = zlib.compressobj()
-
-        # data accumulates bytes to be compressed for the IDAT chunk;
-        # it's compressed when sufficiently large.
-        data = bytearray()
-
-        for i, row in enumerate(rows):
-            # Add "None" filter type.
-            # Currently, it's essential that this filter type be used
-            # for every scanline as
-            # we do not mark the first row of a reduced pass image;
-            # that means we could accidentally compute
-            # the wrong filtered scanline if we used
-            # "up", "average", or "paeth" on such a line.
-            data.append(0)
-            data.extend(row)
-            if len(data) > self.chunk_limit:
-                compressed = compressor.compress(data)
+            level = zlib.Z_DEFAULT_COMPRESSION
+
+        if self.strategy is not None:
+            strategy = self.strategy
+        else:
+            strategy = zlib.Z_DEFAULT_STRATEGY
+
+        # The number of rows, counted by iter_blocks.
+        nrows = [0]
+
+        # Filter unit, as for Reader.undo_filter.
+        fu = max(1, (self.bitdepth * self.planes) // 8)
+        # The indexes of the rows that start a pass,
+        # and so have no previous row to be filtered against.
+        if self.interlace:
+            pass_starts = set()
+            start = 0
+            for lines in adam7_generate(self.width, self.height):
+                pass_starts.add(start)
+                start += len(list(lines))
+        else:
+            pass_starts = {0}
+
+        def iter_blocks(limit):
+            """
+            Yield the filtered data of all the rows
+            in blocks of a little over `limit` bytes.
+            """
+
+            # data accumulates bytes to be compressed for the IDAT chunk;
+            # it's compressed when sufficiently large.
+            data = bytearray()
+            # The previous (unfiltered) scanline;
+            # None at the beginning of a pass.
+            previous = None
+
+            for i, row in enumerate(rows):
+                if self.filter_type == 0:
+                    # Add "None" filter type.
+                    data.append(0)
+                    data.extend(row)
+                else:
+                    if i in pass_starts:
+                        previous = None
+                    row = bytearray(row)
+                    if self.filter_type == 'adaptive':
+                        filter_type, filtered = filter_scanline_adaptive(
+                            row, fu, previous)
+                    else:
+                        filter_type = self.filter_type
+                        filtered = filter_scanline(
+                            filter_type, row, fu, previous)
+                    data.append(filter_type)
+                    data.extend(filtered)
+                    previous = row
+                nrows[0] = i + 1
+                if len(data) > limit:
+                    yield data
+                    data = bytearray()
+            yield data
+
+        if self.workers is not None and self.workers > 1:
+            strips = iter_blocks(min(self.chunk_limit, STRIP_BYTES))
+            for compressed in compress_strips(
+                    strips, level, self.workers, strategy):
+                write_chunk(outfile, b'IDAT', compressed)
+        else:
+            compressor = zlib.compressobj(
+                level, zlib.DEFLATED, zlib.MAX_WBITS,
+                zlib.DEF_MEM_LEVEL, strategy)
+            # The output for the last block is written with
+            # the flushed output, in one chunk.
+            compressed = b''
+            for data in iter_blocks(self.chunk_limit):
                 if len(compressed):
                     write_chunk(outfile, b'IDAT', compressed)
-                data = bytearray()
-
-        compressed = compressor.compress(bytes(data))
-        flushed = compressor.flush()
-        if len(compressed) or len(flushed):
-            write_chunk(outfile, b'IDAT', compressed + flushed)
+                compressed = compressor.compress(data)
+            compressed += compressor.flush()
+            if len(compressed):
+                write_chunk(outfile, b'IDAT', compressed)
         # http://www.w3.org/TR/PNG/#11IEND
         write_chunk(outfile, b'IEND')
-        return i + 1
+        return nrows[0]
 
     def write_preamble(self, outfile):
         # http://www.w3.org/TR/PNG/#5PNG-file-signature
@@ -825,13 +982,27 @@ class Writer:
         Write an array that holds all the image values
         as a PNG file on the output file.
         See also :meth:`write` method.
+
+        `pixels` can also be any C-contiguous buffer
+        (of any shape, such as a 2- or 3-dimensional NumPy array)
+        of 1- or 2-byte unsigned values;
+        its rows are then written from ``memoryview`` slices of it,
+        without the values being copied.
         """
 
+        vpi = self.width * self.height * self.planes
+        view = flat_buffer(pixels)
+        if view is not None:
+            if len(view) != vpi:
+                raise ProtocolError(
+                    "buffer has %d values, but image has %d"
+                    % (len(view), vpi))
+            pixels = view
+
         if self.interlace:
             if type(pixels) != array:
                 # Coerce to array type
-                fmt = 'BH'[self.bitdepth > 8]
-                pixels = array(fmt, pixels)
+                pixels = row_array('BH'[self.bitdepth > 8], pixels)
             self.write_passes(outfile, self.array_scanlines_interlace(pixels))
         else:
             self.write_passes(outfile, self.array_scanlines(pixels))
@@ -892,6 +1063,210 @@ class Writer:
                 yield row
 
 
+# The largest strip of filtered data that
+# a Writer with `workers` compresses as a unit.
+STRIP_BYTES = 2 ** 18
+
+
+def compress_strips(strips, level=zlib.Z_DEFAULT_COMPRESSION, workers=None,
+                    strategy=zlib.Z_DEFAULT_STRATEGY):
+    """
+    Compress the byte strings from `strips` (an iterable)
+    as a single ``zlib`` stream,
+    compressing the strips concurrently on `workers` threads
+    (``zlib`` releases the GIL whilst it compresses).
+    Yields the compressed data of each strip, in order;
+    the first also holds the ``zlib`` header and
+    the last also holds the end of the stream.
+
+    As in ``pigz``,
+    each strip is compressed separately as raw deflate data
+    ending with a ``Z_SYNC_FLUSH``,
+    so that it ends on a byte boundary
+    and can be followed directly by the next;
+    each is primed with the last 32 KiB of the strip before it,
+    so that little compression is lost at the joins.
+    `strategy` is passed to ``zlib.compressobj``.
+    """
+
+    def compress(data, dictionary):
+        if dictionary:
+            compressor = zlib.compressobj(
+                level, zlib.DEFLATED, -zlib.MAX_WBITS,
+                zlib.DEF_MEM_LEVEL, strategy, dictionary)
+        else:
+            compressor = zlib.compressobj(
+                level, zlib.DEFLATED, -zlib.MAX_WBITS,
+                zlib.DEF_MEM_LEVEL, strategy)
+        return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    header = zlib.compress(b'', level)[:2]
+    checksum = zlib.adler32(b'')
+    dictionary = b''
+    # Futures for the compressed strips, in order.
+    pending = collections.deque()
+    with concurrent.futures.ThreadPoolExecutor(workers) as executor:
+        for data in strips:
+            data = bytes(data)
+            checksum = zlib.adler32(data, checksum)
+            pending.append(executor.submit(compress, data, dictionary))
+            dictionary = (dictionary + data[-32768:])[-32768:]
+            # Keep at most two strips per thread in memory.
+            while len(pending) > 2 * workers:
+                yield header + pending.popleft().result()
+                header = b''
+        while len(pending) > 1:
+            yield header + pending.popleft().result()
+            header = b''
+    # The stream is ended with an empty final block and the checksum.
+    end = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS).flush()
+    end += struct.pack('!L', checksum & 0xffffffff)
+    if pending:
+        yield header + pending.popleft().result() + end
+    else:
+        yield header + end
+
+
+# The settings that each `preset` of Writer stands for.
+# Binary masks compress best unfiltered, at the highest level
+# (zlib.Z_RLE is much faster, but the output is several times bigger);
+# photographs need filtering,
+# and zlib.Z_FILTERED suits the small values that filters leave.
+compression_presets = dict(
+    mask=dict(compression=9, filter_type=0,
+              strategy=zlib.Z_DEFAULT_STRATEGY),
+    photo=dict(compression=6, filter_type='adaptive',
+               strategy=zlib.Z_FILTERED),
+)
+
+# The cost of a filtered byte for filter_scanline_adaptive:
+# its absolute value as a signed byte.
+filter_costs = [min(x, 256 - x) for x in range(256)]
+
+
+def filter_scanline(filter_type, line, fu, previous=None):
+    """
+    Apply a scanline filter to a scanline;
+    the reverse of :meth:`Reader.undo_filter`.
+    `filter_type` is the filter type (0 to 4);
+    `line` is the (unfiltered) scanline, as a sequence of bytes;
+    `fu` is the filter unit
+    (the number of bytes per pixel, but at least 1);
+    `previous` is the previous (unfiltered) scanline,
+    or ``None`` if there is none
+    (for the first scanline of the image, or of a reduced pass).
+    Returns the filtered bytes (as a fresh ``bytearray``),
+    not including the filter type byte.
+    """
+
+    if previous is None:
+        previous = bytes(len(line))
+    if numpy is not None:
+        return bytearray(filter_scanline_numpy(
+            filter_type, line, fu, previous).tobytes())
+
+    out = bytearray(line)
+    if filter_type == 0:
+        return out
+    n = len(line)
+    # The values to the left (a), above (b), and above and to the left (c).
+    a = bytes(fu) + bytes(line[:n - fu])
+    b = previous
+    c = bytes(fu) + bytes(previous[:n - fu])
+    if filter_type == 1:
+        for i in range(n):
+            out[i] = (line[i] - a[i]) & 0xff
+    elif filter_type == 2:
+        for i in range(n):
+            out[i] = (line[i] - b[i]) & 0xff
+    elif filter_type == 3:
+        for i in range(n):
+            out[i] = (line[i] - ((a[i] + b[i]) >> 1)) & 0xff
+    else:
+        for i in range(n):
+            ai = a[i]
+            bi = b[i]
+            ci = c[i]
+            p = ai + bi - ci
+            pa = abs(p - ai)
+            pb = abs(p - bi)
+            pc = abs(p - ci)
+            if pa <= pb and pa <= pc:
+                pr = ai
+            elif pb <= pc:
+                pr = bi
+            else:
+                pr = ci
+            out[i] = (line[i] - pr) & 0xff
+    return out
+
+
+def filter_scanline_numpy(filter_type, line, fu, previous):
+    """
+    As :func:`filter_scanline`, using numpy;
+    `previous` is required,
+    and the result is a ``numpy.uint8`` array.
+    Unlike undoing a filter, applying one
+    only depends on the unfiltered bytes,
+    so every filter is a whole-row operation.
+    """
+
+    x = numpy.frombuffer(line, dtype=numpy.uint8).astype(numpy.int16)
+    if filter_type == 0:
+        return x.astype(numpy.uint8)
+    b = numpy.frombuffer(previous, dtype=numpy.uint8).astype(numpy.int16)
+    a = numpy.zeros_like(x)
+    a[fu:] = x[:-fu]
+    if filter_type == 1:
+        predictor = a
+    elif filter_type == 2:
+        predictor = b
+    elif filter_type == 3:
+        predictor = (a + b) >> 1
+    else:
+        c = numpy.zeros_like(b)
+        c[fu:] = b[:-fu]
+        p = a + b - c
+        pa = numpy.abs(p - a)
+        pb = numpy.abs(p - b)
+        pc = numpy.abs(p - c)
+        predictor = numpy.where((pa <= pb) & (pa <= pc), a,
+                                numpy.where(pb <= pc, b, c))
+    return (x - predictor).astype(numpy.uint8)
+
+
+def filter_scanline_adaptive(line, fu, previous=None):
+    """
+    Choose a filter type for the scanline `line`
+    (the arguments are as for :func:`filter_scanline`),
+    using the heuristic that the PNG specification suggests:
+    the filter whose output has the least sum of absolute values,
+    taking each byte as signed.
+    Returns a (*filter_type*, *filtered*) pair.
+    """
+
+    if previous is None:
+        # Without a previous line, "up" is the same as "none",
+        # and "paeth" is the same as "sub";
+        # "average" still differs.
+        filter_types = (0, 1, 3)
+    else:
+        filter_types = (0, 1, 2, 3, 4)
+    best = None
+    for filter_type in filter_types:
+        filtered = filter_scanline(filter_type, line, fu, previous)
+        if numpy is not None:
+            f = numpy.frombuffer(filtered, dtype=numpy.uint8)
+            cost = int(numpy.minimum(f, 256 - f.astype(numpy.int16)).sum())
+        else:
+            cost = sum(map(filter_costs.__getitem__, filtered))
+        if best is None or cost < best[0]:
+            best = (cost, filter_type, filtered)
+    return best[1], best[2]
+
+
 def write_chunk(outfile, tag, data=b''):
     """
     Write a PNG chunk to the output file, including length and
@@ -917,6 +1292,79 @@ def write_chunks(out, chunks):
         write_chunk(out, *chunk)
 
 
+def flat_buffer(a):
+    """
+    If `a` is a C-contiguous buffer
+    (of any number of dimensions)
+    of 1-byte or 2-byte unsigned values (or booleans),
+    return a 1-dimensional ``memoryview`` of its values
+    (with format ``'B'`` or ``'H'``), sharing its memory;
+    otherwise return ``None``.
+    """
+
+    try:
+        view = memoryview(a)
+    except TypeError:
+        return None
+    format = view.format.lstrip('@=')
+    if format not in ('B', 'H', '?') or not view.c_contiguous:
+        return None
+    view = view.cast('B')
+    if format == 'H':
+        view = view.cast('H')
+    return view
+
+
+def buffer_rows(a, planes):
+    """
+    If `a` is a C-contiguous 2- or 3-dimensional buffer
+    (such as a NumPy array)
+    that :func:`flat_buffer` accepts,
+    return (*width*, *height*, *bitdepth*, *rows*),
+    where *rows* is a list of ``memoryview`` slices of `a`,
+    one for each row;
+    otherwise return ``None``.
+    A 3-dimensional buffer has one value per channel on its last axis;
+    a 2-dimensional one has the channels of each row side by side.
+    """
+
+    view = flat_buffer(a)
+    if view is None:
+        return None
+    shape = memoryview(a).shape
+    if len(shape) == 3:
+        if shape[2] != planes:
+            raise ProtocolError(
+                "array has %d channels, but mode has %d"
+                % (shape[2], planes))
+        width = shape[1]
+    elif len(shape) == 2:
+        width = shape[1] // planes
+    else:
+        return None
+    height = shape[0]
+    bitdepth = dict(B=8, H=16).get(memoryview(a).format.lstrip('@='), 1)
+    vpr = width * planes
+    rows = [view[y * vpr: (y + 1) * vpr] for y in range(height)]
+    return width, height, bitdepth, rows
+
+
+def row_array(typecode, row):
+    """
+    Return the values of `row` as a fresh ``array`` of `typecode`.
+    A buffer of the same item size is copied as it is,
+    rather than value by value.
+    """
+
+    a = array(typecode)
+    view = flat_buffer(row)
+    if view is not None and view.itemsize == a.itemsize:
+        a.frombytes(view.cast('B'))
+    else:
+        a.extend(row)
+    return a
+
+
 def rescale_rows(rows, rescale):
     """
     Take each row in rows (an iterator) and yield
@@ -927,10 +1375,6 @@ def rescale_rows(rows, rescale):
     with one element per channel.
     """
 
-    # One factor for each channel
-    fs = [float(2 ** s[1] - 1)/float(2 ** s[0] - 1)
-          for s in rescale]
-
     # Assume all target_bitdepths are the same
     target_bitdepths = set(s[1] for s in rescale)
     assert len(target_bitdepths) == 1
@@ -940,19 +1384,35 @@ def rescale_rows(rows, rescale):
     # Number of channels
     n_chans = len(rescale)
 
+    # One table for each channel
+    tables = [rescale_table(*s) for s in rescale]
+    if numpy is not None:
+        tables = [numpy.array(table, dtype=typecode) for table in tables]
+
     for row in rows:
-        rescaled_row = array(typecode, iter(row))
+        if numpy is not None:
+            row = numpy.asarray(row)
+            rescaled_row = numpy.empty(len(row), dtype=typecode)
+            for i in range(n_chans):
+                rescaled_row[i::n_chans] = tables[i][row[i::n_chans]]
+            yield array(typecode, rescaled_row.tobytes())
+            continue
+        if len(set(rescale)) == 1:
+            # The same table for every channel.
+            yield array(typecode, map(tables[0].__getitem__, row))
+            continue
+        rescaled_row = array(typecode, bytes(len(row) * (1 + (typecode == 'H'))))
         for i in range(n_chans):
-            channel = array(
-                typecode,
-                (int(round(fs[i] * x)) for x in row[i::n_chans]))
-            rescaled_row[i::n_chans] = channel
+            rescaled_row[i::n_chans] = array(
+                typecode, map(tables[i].__getitem__, row[i::n_chans]))
         yield rescaled_row
 
 
 def pack_rows(rows, bitdepth):
     """Yield packed rows that are a byte array.
     Each byte is packed with the values from several pixels.
+    :class:`ProtocolError` is raised for a value
+    that does not fit in `bitdepth` bits.
     """
 
     assert bitdepth < 8
@@ -961,27 +1421,42 @@ def pack_rows(rows, bitdepth):
     # samples per byte
     spb = int(8 / bitdepth)
 
-    def make_byte(block):
-        """Take a block of (2, 4, or 8) values,
-        and pack them into a single byte.
-        """
-
-        res = 0
-        for v in block:
-            res = (res << bitdepth) + v
-        return res
+    if numpy is not None:
+        # The shift of each value within its byte.
+        shifts = numpy.arange(8 - bitdepth, -1, -bitdepth, dtype=numpy.uint8)
 
-    for row in rows:
-        a = bytearray(row)
+    for y, row in enumerate(rows):
+        try:
+            a = bytearray(row)
+        except ValueError:
+            # A value outside range(0, 256).
+            a = None
+        if a is None or (a and max(a) >> bitdepth):
+            raise ProtocolError(
+                "row %d has a value that does not fit in %d bits"
+                % (y, bitdepth))
         # Adding padding bytes so we can group into a whole
         # number of spb-tuples.
-        n = float(len(a))
-        extra = math.ceil(n / spb) * spb - n
-        a.extend([0] * int(extra))
-        # Pack into bytes.
-        # Each block is the samples for one byte.
-        blocks = group(a, spb)
-        yield bytearray(make_byte(block) for block in blocks)
+        a.extend(bytes(-len(a) % spb))
+        if numpy is not None:
+            # Each row of blocks is the samples for one byte.
+            blocks = numpy.frombuffer(a, dtype=numpy.uint8).reshape(-1, spb)
+            yield bytearray(
+                numpy.bitwise_or.reduce(blocks << shifts, axis=1).tobytes())
+            continue
+        # Written as digits in base 2**bitdepth,
+        # the values of each byte are its digits.
+        digits = a.translate(pack_digits)
+        if bitdepth == 4:
+            yield bytearray.fromhex(digits.decode('ascii'))
+        else:
+            yield bytearray(int(b'0' + digits, 2 ** bitdepth).to_bytes(
+                len(a) // spb, 'big'))
+
+
+# Maps each value (of up to 4 bits) to its hexadecimal digit
+# (any other byte value maps to a character that is not a digit).
+pack_digits = b'0123456789abcdef'.ljust(256, b'x')
 
 
 def unpack_rows(rows):
@@ -989,8 +1464,11 @@ def unpack_rows(rows):
     to being a sequence of bytes.
     """
     for row in rows:
-        fmt = '!%dH' % len(row)
-        yield bytearray(struct.pack(fmt, *row))
+        a = row_array('H', row)
+        # PNG is big-endian.
+        if sys.byteorder == 'little':
+            a.byteswap()
+        yield bytearray(a.tobytes())
 
 
 def make_palette_chunks(palette):
@@ -1194,6 +1672,20 @@ def from_array(a, mode=None, info={}):
     if height:
         info["height"] = height
 
+    planes = len(mode)
+    if 'planes' in info:
+        if info['planes'] != planes:
+            raise Error("info['planes'] should match mode.")
+
+    # A buffer gives its dimensions directly,
+    # and its rows are views of it.
+    buffered = buffer_rows(a, planes)
+    if buffered is not None:
+        width, height, bitdepth, a = buffered
+        info.setdefault('width', width)
+        info.setdefault('height', height)
+        info.setdefault('bitdepth', bitdepth)
+
     if "height" not in info:
         try:
             info['height'] = len(a)
@@ -1201,22 +1693,18 @@ def from_array(a, mode=None, info={}):
             raise ProtocolError(
                 "len(a) does not work, supply info['height'] instead.")
 
-    planes = len(mode)
-    if 'planes' in info:
-        if info['planes'] != planes:
-            raise Error("info['planes'] should match mode.")
-
-    # In order to work out whether we the array is 2D or 3D we need its
-    # first row, which requires that we take a copy of its iterator.
-    # We may also need the first row to derive width and bitdepth.
-    a, t = itertools.tee(a)
-    row = next(t)
-    del t
+    if buffered is None:
+        # In order to work out whether we the array is 2D or 3D we need its
+        # first row, which requires that we take a copy of its iterator.
+        # We may also need the first row to derive width and bitdepth.
+        a, t = itertools.tee(a)
+        row = next(t)
+        del t
 
-    testelement = row
-    if 'width' not in info:
-        width = len(row) // planes
-        info['width'] = width
+        testelement = row
+        if 'width' not in info:
+            width = len(row) // planes
+            info['width'] = width
 
     if 'bitdepth' not in info:
         try:
@@ -1296,14 +1784,90 @@ class Image:
         w.write(file, self.rows)
 
 
+class _MemoryFile:
+    """
+    A read-only file-like object over a buffer
+    (``bytes``, ``bytearray``, ``array``, ``mmap``, and so on).
+    Unlike :class:`io.BytesIO`, the buffer is not copied and
+    :meth:`read` returns ``memoryview`` slices of it.
+    """
+
+    def __init__(self, buffer):
+        self.source = buffer
+        self.buffer = memoryview(buffer).cast('B')
+        self.offset = 0
+
+    def close(self):
+        """Release the buffer, and close it if it is an ``mmap``.
+        The memory map can only be closed once
+        all the slices returned by :meth:`read` have been released.
+        """
+
+        self.buffer.release()
+        if isinstance(self.source, mmap.mmap):
+            self.source.close()
+
+    def read(self, n=-1):
+        start = self.offset
+        if n is None or n < 0:
+            end = len(self.buffer)
+        else:
+            end = min(start + n, len(self.buffer))
+        self.offset = end
+        return self.buffer[start:end]
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.offset
+        elif whence == io.SEEK_END:
+            offset += len(self.buffer)
+        self.offset = max(0, offset)
+        return self.offset
+
+    def tell(self):
+        return self.offset
+
+
+class RowBuffers:
+    """
+    Buffers that a :class:`Reader` can reuse for
+    decoding the rows of a straightlaced image,
+    so that decoding an image does not allocate per row.
+    Pass the same instance (with the `buffers` argument)
+    to the :class:`Reader` of each image in turn;
+    the buffers are only reallocated when the row size changes.
+    An instance must not be used by two Readers at the same time,
+    but a Reader can be abandoned part way through an image,
+    and the buffers passed on to the next one.
+    """
+
+    def __init__(self):
+        # Decompressed data that has not yet been made into rows.
+        self.data = bytearray()
+        # The two row buffers used alternately.
+        self.pair = (bytearray(), bytearray())
+
+    def rows(self, row_bytes):
+        """Return the pair of row buffers,
+        each resized to `row_bytes` if necessary."""
+
+        for row in self.pair:
+            if len(row) != row_bytes:
+                row[:] = bytes(row_bytes)
+        return self.pair
+
+
 class Reader:
     """
     Pure Python PNG decoder in pure Python.
     """
 
-    def __init__(self, _guess=None, filename=None, file=None, bytes=None):
+    def __init__(self, _guess=None, filename=None, file=None, bytes=None,
+                 max_pixels=None, max_decompressed=None, zero_copy=False,
+                 buffers=None, threaded=False):
         """
-        The constructor expects exactly one keyword argument.
+        The constructor expects exactly one keyword argument
+        that specifies the input.
         If you supply a positional argument instead,
         it will guess the input type.
         Choose from the following keyword arguments:
@@ -1315,6 +1879,49 @@ class Reader:
         bytes
           ``bytes`` or ``bytearray`` with PNG data.
 
+        The following optional keyword arguments
+        limit the resources that decoding may use:
+
+        max_pixels
+          Largest allowed ``width * height``.
+        max_decompressed
+          Largest allowed size, in bytes,
+          of the decompressed ``IDAT`` data.
+
+        Both are checked when the ``IHDR`` chunk is processed,
+        so that an oversized image fails before
+        any pixel data is decompressed;
+        `max_decompressed` is also enforced whilst decompressing.
+        If a limit is exceeded :class:`LimitError` is raised.
+
+        If `zero_copy` is true then
+        a file given with `filename` is memory mapped, and
+        a buffer given with `bytes` is used in place;
+        in both cases the data of each chunk
+        (as returned by :meth:`chunk`)
+        is a ``memoryview`` slice of the input rather than a copy,
+        and is handed to ``zlib`` as it is.
+        The memory map is released by :meth:`close`
+        (a Reader is also a context manager that closes it on exit).
+
+        If `buffers` is a :class:`RowBuffers` instance then
+        the rows of a straightlaced image
+        are reconstructed in its buffers.
+        For an 8-bit image,
+        the rows returned by :meth:`read` are then those buffers,
+        so a row is only valid until the row after the next one is read
+        (and must be copied if it is to be kept).
+
+        If `threaded` is true then
+        the ``IDAT`` chunks are read and decompressed
+        on a background thread,
+        which stays at most :data:`THREAD_QUEUE_BLOCKS` blocks ahead,
+        whilst the calling thread undoes the filters and
+        converts the rows.
+        ``zlib`` releases the GIL whilst it decompresses,
+        so for large images the two overlap.
+        The file must not be used by anything else until
+        the rows have all been read.
         """
         keywords_supplied = (
             (_guess is not None) +
@@ -1324,8 +1931,25 @@ class Reader:
         if keywords_supplied != 1:
             raise TypeError("Reader() takes exactly 1 argument")
 
+        self.max_pixels = max_pixels
+        self.max_decompressed = max_decompressed
+        self.buffers = buffers
+        self.threaded = threaded
+        # A threading.Event that stops decoding when set;
+        # see async_read.
+        self._cancel = None
+        # Whether the IEND chunk has been read; see iter_stream.
+        self._iend = False
+        # Whether self.file was opened (or mapped) by this Reader,
+        # and so is closed by close.
+        self._opened = False
+
         # Will be the first 8 bytes, later on.  See validate_signature.
         self.signature = None
+        # The position in the file of the signature
+        # (the file need not start with the PNG data),
+        # or None if the file cannot tell.
+        self.start = None
         self.transparent = None
         # A pair of (len,type) if a chunk has been read but its data and
         # checksum have not (in other words the file position is just
@@ -1342,21 +1966,60 @@ class Reader:
                 file = _guess
 
         if bytes is not None:
-            self.file = io.BytesIO(bytes)
+            if zero_copy:
+                self.file = _MemoryFile(bytes)
+            else:
+                self.file = io.BytesIO(bytes)
         elif filename is not None:
             self.file = open(filename, "rb")
+            if zero_copy:
+                try:
+                    m = mmap.mmap(self.file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+                except ValueError:
+                    # An empty file cannot be mapped;
+                    # reading it in the usual way gives the right error.
+                    pass
+                else:
+                    # The map does not need the file to stay open.
+                    self.file.close()
+                    self.file = _MemoryFile(m)
+            self._opened = True
         elif file is not None:
             self.file = file
         else:
             raise ProtocolError("expecting filename, file or bytes array")
 
+    def close(self):
+        """
+        Close the input file if the Reader opened it
+        (that is, if it was given with `filename`),
+        and release the input of `zero_copy` mode.
+        The data of the chunks (as returned by :meth:`chunk`)
+        must not be used after this.
+        A file object given with `file` is left open.
+        """
+
+        if isinstance(self.file, _MemoryFile):
+            self.file.close()
+        elif self._opened:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
     def chunk(self, lenient=False):
         """
         Read the next PNG chunk from the input file;
         returns a (*type*, *data*) tuple.
         *type* is the chunk's type as a byte string
         (all PNG chunk types are 4 bytes long).
-        *data* is the chunk's data content, as a byte string.
+        *data* is the chunk's data content, as a byte string
+        (or a ``memoryview``, when the Reader was created with
+        `zero_copy`).
 
         If the optional `lenient` argument evaluates to `True`,
         checksum failures will raise warnings rather than exceptions.
@@ -1371,6 +2034,8 @@ class Reader:
             raise ChunkError("No more chunks.")
         length, type = self.atchunk
         self.atchunk = None
+        if type == b'IEND':
+            self._iend = True
 
         data = self.file.read(length)
         if len(data) != length:
@@ -1441,20 +2106,35 @@ class Reader:
         # byte is used instead.
         fu = max(1, self.psize)
 
+        if numpy is not None and len(scanline) % fu == 0:
+            # On the first line 'up' is the same as 'null' and
+            # 'paeth' is the same as 'sub'.
+            if not previous:
+                if filter_type == 2:
+                    return result
+                if filter_type == 4:
+                    filter_type = 1
+            fn = (None,
+                  undo_filter_sub_numpy,
+                  undo_filter_up_numpy,
+                  undo_filter_average,
+                  undo_filter_paeth_numpy)[filter_type]
+        else:
+            fn = (None,
+                  undo_filter_sub,
+                  undo_filter_up,
+                  undo_filter_average,
+                  undo_filter_paeth)[filter_type]
+
         # For the first line of a pass, synthesize a dummy previous
         # line.  An alternative approach would be to observe that on the
         # first line 'up' is the same as 'null', 'paeth' is the same
         # as 'sub', with only 'average' requiring any special case.
         if not previous:
-            previous = bytearray([0] * len(scanline))
+            previous = bytearray(len(scanline))
 
         # Call appropriate filter algorithm.  Note that 0 has already
         # been dealt with.
-        fn = (None,
-              undo_filter_sub,
-              undo_filter_up,
-              undo_filter_average,
-              undo_filter_paeth)[filter_type]
         fn(fu, scanline, previous, result)
         return result
 
@@ -1464,6 +2144,39 @@ class Reader:
         Return a single array of values.
         """
 
+        for _, a in self._iter_deinterlace([raw]):
+            pass
+        return a
+
+    def _iter_deinterlace(self, byte_blocks, out=None, planar=False):
+        """
+        Iterator that undoes filters and deinterlaces,
+        one Adam7 pass at a time.
+        `byte_blocks` should be an iterable that yields the raw bytes
+        in blocks of arbitrary size;
+        it is only read as far as is needed for each pass.
+        After each of the seven passes a
+        (*pass*, *values*) pair is yielded,
+        where *pass* counts from 0, and
+        *values* is the single array of values of the whole image,
+        with the pixels of that pass and all earlier ones filled in.
+        It is the same array every time.
+
+        If `out` (a writable ``memoryview`` of bytes,
+        sized as for :meth:`read_into`) is given,
+        the values are written into it, and it is yielded as *values*.
+        If `planar` is true,
+        the values are arranged one whole channel after another
+        (as :meth:`read_planes` has them),
+        rather than pixel by pixel.
+
+        When ``numpy`` is available,
+        the filters of each pass are undone together
+        (see :func:`undo_filters_numpy`),
+        and its rows are scattered into the image
+        in one strided assignment.
+        """
+
         # Values per row (of the target image)
         vpr = self.width * self.planes
 
@@ -1472,43 +2185,100 @@ class Reader:
         # Interleaving writes to the output array randomly
         # (well, not quite), so the entire output array must be in memory.
         # Make a result array, and make it big enough.
-        if self.bitdepth > 8:
-            a = array('H', [0] * vpi)
+        if out is not None:
+            a = out
+            if self.bitdepth > 8:
+                out = out.cast('H')
+        elif self.bitdepth > 8:
+            a = out = array('H', bytes(2 * vpi))
         else:
-            a = bytearray([0] * vpi)
-        source_offset = 0
+            a = out = bytearray(vpi)
 
-        for lines in adam7_generate(self.width, self.height):
+        if numpy is not None:
+            grid = numpy.frombuffer(
+                a, dtype=(numpy.uint8, numpy.uint16)[self.bitdepth > 8])
+            if planar:
+                grid = grid.reshape(self.planes, self.height, self.width)
+            else:
+                grid = grid.reshape(self.height, self.width, self.planes)
+
+        blocks = iter(byte_blocks)
+        buffer = bytearray()
+
+        def take(n):
+            """The next `n` bytes of raw pixel data."""
+            while len(buffer) < n:
+                some_bytes = next(blocks, None)
+                if some_bytes is None:
+                    raise FormatError(
+                        'Wrong size for decompressed IDAT chunk.')
+                buffer.extend(some_bytes)
+            result = buffer[:n]
+            del buffer[:n]
+            return result
+
+        for pass_index, (xstart, ystart, xstep, ystep) in enumerate(adam7):
+            if xstart >= self.width:
+                yield pass_index, a
+                continue
+            # Pixels per row (reduced pass image)
+            ppr = int(math.ceil((self.width - xstart) / float(xstep)))
+            # Row size in bytes for this pass.
+            row_size = int(math.ceil(self.psize * ppr))
+            if numpy is not None:
+                # The filters of the whole pass are undone together.
+                rows = len(range(ystart, self.height, ystep))
+                recon = undo_filters_numpy(
+                    max(1, self.psize), take((row_size + 1) * rows),
+                    row_size)
+                # The values of the whole pass.
+                if self.bitdepth >= 8:
+                    pass_values = recon.tobytes()
+                else:
+                    pass_values = bytearray()
+                    for row in recon:
+                        pass_values.extend(
+                            self._bytes_to_values(row.tobytes(), width=ppr))
+                # PNG is big-endian.
+                values = numpy.frombuffer(
+                    pass_values, dtype=('>u2', numpy.uint8)[
+                        self.bitdepth <= 8])
+                values = values.reshape(-1, ppr, self.planes)
+                if planar:
+                    grid[:, ystart::ystep, xstart::xstep] = \
+                        values.transpose(2, 0, 1)
+                else:
+                    grid[ystart::ystep, xstart::xstep] = values
+                yield pass_index, a
+                continue
             # The previous (reconstructed) scanline.
             # `None` at the beginning of a pass
             # to indicate that there is no previous line.
             recon = None
-            for x, y, xstep in lines:
-                # Pixels per row (reduced pass image)
-                ppr = int(math.ceil((self.width - x) / float(xstep)))
-                # Row size in bytes for this pass.
-                row_size = int(math.ceil(self.psize * ppr))
-
-                filter_type = raw[source_offset]
-                source_offset += 1
-                scanline = raw[source_offset: source_offset + row_size]
-                source_offset += row_size
+            for y in range(ystart, self.height, ystep):
+                scanline = take(row_size + 1)
+                filter_type = scanline[0]
+                del scanline[0]
                 recon = self.undo_filter(filter_type, scanline, recon)
                 # Convert so that there is one element per pixel value
                 flat = self._bytes_to_values(recon, width=ppr)
-                if xstep == 1:
-                    assert x == 0
+                if planar:
+                    for i in range(self.planes):
+                        offset = (i * self.height + y) * self.width
+                        out[offset + xstart: offset + self.width: xstep] = \
+                            flat[i:: self.planes]
+                elif xstep == 1:
+                    assert xstart == 0
                     offset = y * vpr
-                    a[offset: offset + vpr] = flat
+                    out[offset: offset + vpr] = flat
                 else:
-                    offset = y * vpr + x * self.planes
+                    offset = y * vpr + xstart * self.planes
                     end_offset = (y + 1) * vpr
                     skip = self.planes * xstep
                     for i in range(self.planes):
-                        a[offset + i: end_offset: skip] = \
+                        out[offset + i: end_offset: skip] = \
                             flat[i:: self.planes]
-
-        return a
+            yield pass_index, a
 
     def _iter_bytes_to_values(self, byte_rows):
         """
@@ -1530,44 +2300,167 @@ class Reader:
         if self.bitdepth == 8:
             return bytearray(bs)
         if self.bitdepth == 16:
-            return array('H',
-                         struct.unpack('!%dH' % (len(bs) // 2), bs))
+            out = array('H')
+            out.frombytes(bs)
+            # PNG is big-endian.
+            if sys.byteorder == 'little':
+                out.byteswap()
+            return out
 
         assert self.bitdepth < 8
         if width is None:
             width = self.width
-        # Samples per byte
-        spb = 8 // self.bitdepth
-        out = bytearray()
-        mask = 2**self.bitdepth - 1
-        shifts = [self.bitdepth * i
-                  for i in reversed(list(range(spb)))]
-        for o in bs:
-            out.extend([mask & (o >> i) for i in shifts])
-        return out[:width]
-
-    def _iter_straight_packed(self, byte_blocks):
+        table = unpack_tables[self.bitdepth]
+        out = bytearray(b''.join(map(table.__getitem__, bs)))
+        del out[width:]
+        return out
+
+    def _bytes_to_values8(self, bs):
+        """Convert a packed row of 16-bit values directly into
+        a row of 8-bit values
+        (rounded to nearest, as :meth:`asRGB8` does).
+        Result will be a freshly allocated object,
+        not shared with the argument.
+        """
+
+        assert self.bitdepth == 16
+        if numpy is not None:
+            values = numpy.frombuffer(bs, dtype='>u2').astype(numpy.uint32)
+            # round(v * 255 / 65535) is round(v / 257), and
+            # v / 257 is never exactly half way between two integers.
+            return bytearray(((values + 128) // 257).astype(numpy.uint8))
+        return bytearray(map(rescale_table(16, 8).__getitem__,
+                             self._bytes_to_values(bs)))
+
+    def _iter_decimated(self, rows, scale, average, to_values):
+        """
+        Iterator that yields the rows of the image reduced by `scale`
+        (see the :meth:`read` method).
+        `rows` should be an iterator that yields each row of
+        the source image, and
+        `to_values` a function that converts such a row
+        into a sequence of values
+        (it is only called for rows that are needed).
+        """
+
+        planes = self.planes
+        typecode = 'BH'[self.bitdepth > 8]
+        # Values per row of the result.
+        vpr = ((self.width + scale - 1) // scale) * planes
+
+        if not average:
+            for y, row in enumerate(rows):
+                if y % scale:
+                    continue
+                values = to_values(row)
+                out = array(typecode, bytes(vpr * (1, 2)[typecode == 'H']))
+                for i in range(planes):
+                    out[i::planes] = array(
+                        typecode, values[i::planes * scale])
+                yield out
+            return
+
+        # Number of source pixels across each block of the result.
+        widths = [min(scale, self.width - x)
+                  for x in range(0, self.width, scale)]
+        block = []
+        for y, row in enumerate(rows):
+            block.append(to_values(row))
+            if len(block) < scale and y + 1 < self.height:
+                continue
+            if numpy is not None:
+                a = numpy.array([numpy.asarray(values) for values in block],
+                                dtype=numpy.uint32)
+                a = a.reshape(len(block), self.width, planes).sum(axis=0)
+                sums = numpy.add.reduceat(
+                    a, numpy.arange(0, self.width, scale), axis=0)
+                n = numpy.array(widths, dtype=numpy.uint32) * len(block)
+                out = (sums + n[:, None] // 2) // n[:, None]
+                yield array(typecode, out.astype(typecode).tobytes())
+            else:
+                sums = [0] * vpr
+                for values in block:
+                    for i in range(planes):
+                        for k in range(scale):
+                            column = values[i + k * planes::planes * scale]
+                            for j, v in enumerate(column):
+                                sums[i + j * planes] += v
+                out = array(typecode)
+                for j, v in enumerate(sums):
+                    n = widths[j // planes] * len(block)
+                    out.append((v + n // 2) // n)
+                yield out
+            block = []
+
+    def _iter_straight_packed(self, byte_blocks, buffers=None, out=None,
+                              stop=None):
         """Iterator that undoes the effect of filtering;
         yields each row as a sequence of packed bytes.
         Assumes input is straightlaced.
         `byte_blocks` should be an iterable that yields the raw bytes
         in blocks of arbitrary size.
+
+        Normally each row is a fresh ``bytearray``.
+        If `buffers` (a :class:`RowBuffers`) is given then
+        the rows are reconstructed alternately in its two row buffers
+        (the previous row is needed to undo the filter of the next).
+        If `out` (a writable ``memoryview`` of
+        ``height * row_bytes`` bytes) is given then
+        each row is reconstructed in its place in `out`,
+        and a view of it is yielded.
+        If `stop` is given then
+        only the rows before row `stop` are yielded,
+        and no more of `byte_blocks` is read than they need.
         """
 
         # length of row, in bytes
         rb = self.row_bytes
-        a = bytearray()
+        if numpy is not None:
+            # Undo the filters of up to UNFILTER_ROWS rows at a time,
+            # see :func:`undo_filters_numpy`.
+            yield from self._iter_straight_batched(
+                byte_blocks, buffers, out, stop)
+            return
+        if buffers is None:
+            a = bytearray()
+        else:
+            a = buffers.data
+            del a[:]
+            pair = buffers.rows(rb)
+        # Offset in `a` of the next row;
+        # the rows before it are discarded once per block,
+        # rather than once per row.
+        i = 0
+        y = 0
         # The previous (reconstructed) scanline.
         # None indicates first line of image.
         recon = None
         for some_bytes in byte_blocks:
+            del a[:i]
+            i = 0
             a.extend(some_bytes)
-            while len(a) >= rb + 1:
-                filter_type = a[0]
-                scanline = a[1: rb + 1]
-                del a[: rb + 1]
+            while len(a) - i >= rb + 1:
+                if y == stop:
+                    return
+                filter_type = a[i]
+                # The view of `a` is released before the row is yielded,
+                # so that `a` can still be resized
+                # (by another Reader sharing the same `buffers`)
+                # while this generator is suspended.
+                with memoryview(a)[i + 1: i + rb + 1] as row:
+                    if out is not None:
+                        scanline = out[y * rb: (y + 1) * rb]
+                        scanline[:] = row
+                    elif buffers is not None:
+                        scanline = pair[y & 1]
+                        scanline[:] = row
+                    else:
+                        scanline = bytearray(row)
+                i += rb + 1
+                y += 1
                 recon = self.undo_filter(filter_type, scanline, recon)
                 yield recon
+        del a[:i]
         if len(a) != 0:
             # :file:format We get here with a file format error:
             # when the available bytes (after decompressing) do not
@@ -1575,6 +2468,114 @@ class Reader:
             raise FormatError('Wrong size for decompressed IDAT chunk.')
         assert len(a) == 0
 
+    def _iter_straight_batched(self, byte_blocks, buffers=None, out=None,
+                               stop=None):
+        """As :meth:`_iter_straight_packed`,
+        but using :func:`undo_filters_numpy` to undo the filters of
+        up to :data:`UNFILTER_ROWS` rows at a time
+        (fewer if row `stop` comes sooner).
+        With `buffers`, each batch is copied,
+        a row at a time, into its pair of row buffers.
+        """
+
+        rb = self.row_bytes
+        fu = max(1, self.psize)
+        # Rows still wanted; without `stop`,
+        # the rest of `byte_blocks` is read
+        # so that any excess data is found.
+        if stop is None:
+            wanted = self.height
+        else:
+            wanted = stop
+        if buffers is None:
+            a = bytearray()
+        else:
+            a = buffers.data
+            del a[:]
+            pair = buffers.rows(rb)
+        y = 0
+        # The previous (reconstructed) scanline.
+        recon = None
+        blocks = iter(byte_blocks)
+        while stop is None or y < stop:
+            some_bytes = next(blocks, None)
+            if some_bytes is not None:
+                a.extend(some_bytes)
+                if len(a) < min(UNFILTER_ROWS, wanted - y) * (rb + 1):
+                    continue
+            n = len(a) // (rb + 1)
+            if stop is not None:
+                n = min(n, stop - y)
+            if n:
+                recon_rows = undo_filters_numpy(
+                    fu, a[:n * (rb + 1)], rb, recon)
+                del a[:n * (rb + 1)]
+                recon = recon_rows[-1]
+                if out is not None:
+                    out[y * rb: (y + n) * rb] = recon_rows.reshape(-1)
+                    for j in range(y, y + n):
+                        yield out[j * rb: (j + 1) * rb]
+                elif buffers is not None:
+                    for j in range(y, y + n):
+                        scanline = pair[j & 1]
+                        scanline[:] = recon_rows[j - y].data
+                        yield scanline
+                else:
+                    for row in recon_rows:
+                        yield bytearray(row)
+                y += n
+            if some_bytes is None:
+                break
+        else:
+            return
+        if len(a) != 0:
+            # :file:format We get here with a file format error:
+            # when the available bytes (after decompressing) do not
+            # pack into exact rows.
+            raise FormatError('Wrong size for decompressed IDAT chunk.')
+
+    def chunk_index(self):
+        """
+        Return a list with a (*type*, *offset*, *length*) triple
+        for every chunk in the file, in order, up to and including
+        the ``IEND`` chunk.
+        *offset* is the position in the file of the chunk's data,
+        and *length* is the length of that data.
+
+        Only the length and type of each chunk is read;
+        the file is seeked past the data and checksum,
+        which are neither read nor checked.
+        The input must be seekable;
+        its position is restored afterwards,
+        so the Reader can still be used to decode the image.
+        """
+
+        self.validate_signature()
+        if self.start is None:
+            raise ProtocolError('chunk_index needs a seekable file.')
+        position = self.file.tell()
+        end = self.file.seek(0, io.SEEK_END)
+        self.file.seek(self.start + len(signature))
+        index = []
+        try:
+            while True:
+                x = self._chunk_len_type()
+                if x is None:
+                    break
+                length, type = x
+                offset = self.file.tell()
+                if offset + length + 4 > end:
+                    raise ChunkError(
+                        'Chunk %s too short for required %i octets.'
+                        % (type, length))
+                index.append((type, offset, length))
+                if type == b'IEND':
+                    break
+                self.file.seek(length + 4, io.SEEK_CUR)
+        finally:
+            self.file.seek(position)
+        return index
+
     def validate_signature(self):
         """
         If signature (header) has not been read then read and
@@ -1583,10 +2584,20 @@ class Reader:
 
         if self.signature:
             return
-        self.signature = self.file.read(8)
+        self.start = self._tell()
+        self.signature = bytes(self.file.read(8))
         if self.signature != signature:
             raise FormatError("PNG file has invalid signature.")
 
+    def _tell(self):
+        """The position in the file,
+        or ``None`` if it cannot tell."""
+
+        try:
+            return self.file.tell()
+        except (AttributeError, OSError):
+            return None
+
     def preamble(self, lenient=False):
         """
         Extract the image metadata by reading
@@ -1651,7 +2662,10 @@ class Reader:
         method = '_process_' + type.decode('ascii')
         m = getattr(self, method, None)
         if m:
-            m(data)
+            # The data of these (small) chunks can be kept as attributes,
+            # so it is copied, rather than keeping a zero-copy input
+            # from being released by close.
+            m(bytes(data))
 
     def _process_IHDR(self, data):
         # http://www.w3.org/TR/PNG/#11IHDR
@@ -1695,6 +2709,19 @@ class Reader:
         if int(self.psize) == self.psize:
             self.psize = int(self.psize)
         self.row_bytes = int(math.ceil(self.width * self.psize))
+
+        if (self.max_pixels is not None and
+                self.width * self.height > self.max_pixels):
+            raise LimitError(
+                "Image has %d pixels, more than the limit of %d."
+                % (self.width * self.height, self.max_pixels))
+        if (self.max_decompressed is not None and
+                self._decompressed_size() > self.max_decompressed):
+            raise LimitError(
+                "Image needs %d bytes decompressed,"
+                " more than the limit of %d."
+                % (self._decompressed_size(), self.max_decompressed))
+
         # Stores PLTE chunk if present, and is used to check
         # chunk ordering constraints.
         self.plte = None
@@ -1704,6 +2731,24 @@ class Reader:
         # Stores sBIT chunk if present.
         self.sbit = None
 
+    def _decompressed_size(self):
+        """
+        The size, in bytes, of the decompressed ``IDAT`` data
+        (including the filter type bytes) for this image.
+        """
+
+        if not self.interlace:
+            return self.height * (self.row_bytes + 1)
+        size = 0
+        for xstart, ystart, xstep, ystep in adam7:
+            if xstart >= self.width:
+                continue
+            ppr = int(math.ceil((self.width - xstart) / float(xstep)))
+            rows = int(math.ceil((self.height - ystart) / float(ystep)))
+            if rows > 0:
+                size += rows * (int(math.ceil(self.psize * ppr)) + 1)
+        return size
+
     def _process_PLTE(self, data):
         # http://www.w3.org/TR/PNG/#11PLTE
         if self.plte:
@@ -1774,7 +2819,7 @@ class Reader:
             struct.unpack(fmt, data)
         self.unit_is_meter = bool(unit)
 
-    def read(self, lenient=False):
+    def read(self, lenient=False, scale=1, average=False, bitdepth=None):
         """
         Read the PNG file and decode it.
         Returns (`width`, `height`, `rows`, `info`).
@@ -1786,47 +2831,196 @@ class Reader:
 
         If the optional `lenient` argument evaluates to True,
         checksum failures will raise warnings rather than exceptions.
+
+        If `scale` is greater than 1 then
+        a reduced image is returned that has
+        only every `scale`-th row and every `scale`-th column
+        (starting with the first) of the source image;
+        its size is ``ceil(width / scale)`` by ``ceil(height / scale)``,
+        and the `width`, `height`, and ``info['size']`` returned
+        are those of the reduced image.
+        Every row still has to be decompressed and have its filter undone,
+        but only the rows that are kept are converted to values.
+        If `average` is true,
+        each value is instead the mean (rounded to nearest)
+        of the block of `scale` by `scale` source pixels it replaces
+        (blocks on the right and bottom edges may be smaller).
+        `average` is not allowed for colour mapped images.
+
+        For a 16-bit image, `bitdepth` can be 8;
+        the values are then converted to 8-bit values
+        (rounded to nearest, as :meth:`asRGB8` does)
+        as they are unpacked.
         """
 
-        def iteridat():
-            """Iterator that yields all the ``IDAT`` chunks as strings."""
-            while True:
-                type, data = self.chunk(lenient=lenient)
-                if type == b'IEND':
-                    # http://www.w3.org/TR/PNG/#11IEND
-                    break
-                if type != b'IDAT':
-                    continue
-                # type == b'IDAT'
-                # http://www.w3.org/TR/PNG/#11IDAT
-                if self.colormap and not self.plte:
-                    warnings.warn("PLTE chunk is required before IDAT chunk")
-                yield data
+        if not is_natural(scale) or scale < 1:
+            raise ProtocolError("scale must be a positive integer")
 
         self.preamble(lenient=lenient)
-        raw = decompress(iteridat())
+        raw = self._iter_raw(lenient=lenient)
+
+        if average and scale > 1 and self.colormap:
+            raise ProtocolError(
+                "cannot average the palette indexes of a colour mapped image")
+        if bitdepth not in (None, self.bitdepth) and not (
+                bitdepth == 8 and self.bitdepth == 16):
+            raise ProtocolError(
+                "cannot read a %d-bit image as %r-bit"
+                % (self.bitdepth, bitdepth))
+        downscale = bitdepth == 8 and self.bitdepth == 16
 
         if self.interlace:
             def rows_from_interlace():
                 """Yield each row from an interlaced PNG."""
                 # It's important that this iterator doesn't read
                 # IDAT chunks until it yields the first row.
-                bs = bytearray(itertools.chain(*raw))
                 arraycode = 'BH'[self.bitdepth > 8]
                 # Like :meth:`group` but
                 # producing an array.array object for each row.
-                values = self._deinterlace(bs)
+                for _, values in self._iter_deinterlace(raw):
+                    pass
                 vpr = self.width * self.planes
                 for i in range(0, len(values), vpr):
                     row = array(arraycode, values[i:i+vpr])
                     yield row
             rows = rows_from_interlace()
+            if scale > 1:
+                rows = self._iter_decimated(rows, scale, average,
+                                            lambda row: row)
+        elif scale > 1:
+            rows = self._iter_decimated(self._iter_straight_packed(raw),
+                                        scale, average, self._bytes_to_values)
+        elif downscale:
+            rows = map(self._bytes_to_values8, self._iter_straight_packed(raw))
+            downscale = False
+        elif self.buffers is not None and self.bitdepth == 8:
+            # The reconstructed rows are already the values.
+            rows = self._iter_straight_packed(raw, buffers=self.buffers)
         else:
-            rows = self._iter_bytes_to_values(self._iter_straight_packed(raw))
+            rows = self._iter_bytes_to_values(
+                self._iter_straight_packed(raw, buffers=self.buffers))
+        if downscale:
+            rows = iter_rescale(rows, 16, 8)
+        width = (self.width + scale - 1) // scale
+        height = (self.height + scale - 1) // scale
+        info = self._info(width, height)
+        if bitdepth:
+            info['bitdepth'] = bitdepth
+        return width, height, rows, info
+
+    def read_region(self, x0, y0, x1, y1, lenient=False):
+        """
+        Read the PNG file and decode only a rectangular region of it:
+        the columns from `x0` up to (but not including) `x1` and
+        the rows from `y0` up to (but not including) `y1`.
+        Returns (`width`, `height`, `rows`, `info`)
+        as the :meth:`read` method does,
+        where `width` is ``x1 - x0`` and `height` is ``y1 - y0``.
+
+        For a straightlaced image,
+        the rows above the region still have to be decompressed and
+        have their filter undone (each row depends on the one above),
+        but they are not converted to values;
+        decompression stops as soon as row ``y1 - 1`` is complete;
+        and only the bytes of the region's columns are
+        converted to values.
+
+        An interlaced image is decoded in full and then cropped.
+        """
+
+        self.preamble(lenient=lenient)
+        if not (0 <= x0 < x1 <= self.width and
+                0 <= y0 < y1 <= self.height):
+            raise ProtocolError(
+                "region (%r, %r, %r, %r) is not inside the %d x %d image"
+                % (x0, y0, x1, y1, self.width, self.height))
+        width = x1 - x0
+        height = y1 - y0
+
+        if self.interlace:
+            _, _, rows, info = self.read(lenient=lenient)
+            planes = self.planes
+            rows = (row[x0 * planes: x1 * planes]
+                    for row in itertools.islice(rows, y0, y1))
+            info['size'] = (width, height)
+            return width, height, rows, info
+
+        if self.bitdepth < 8:
+            # Samples per byte
+            spb = 8 // self.bitdepth
+            start = x0 // spb
+            stop = (x1 + spb - 1) // spb
+            skip = x0 % spb
+
+            def convert(row):
+                values = self._bytes_to_values(row[start:stop],
+                                               width=skip + width)
+                return values[skip:]
+        else:
+            start = x0 * self.psize
+            stop = x1 * self.psize
+
+            def convert(row):
+                return self._bytes_to_values(row[start:stop])
+
+        raw = self._iter_raw(lenient=lenient)
+        rows = map(convert, itertools.islice(
+            self._iter_straight_packed(raw, stop=y1), y0, y1))
+        return width, height, rows, self._info(width, height)
+
+    def _iter_raw(self, lenient=False):
+        """
+        Iterator that yields the decompressed ``IDAT`` data,
+        in blocks of a few rows.
+        The :meth:`preamble` must already have been read.
+        """
+
+        def iteridat():
+            """Iterator that yields all the ``IDAT`` chunks as strings."""
+            while True:
+                type, data = self.chunk(lenient=lenient)
+                if type == b'IEND':
+                    # http://www.w3.org/TR/PNG/#11IEND
+                    break
+                if type != b'IDAT':
+                    continue
+                # type == b'IDAT'
+                # http://www.w3.org/TR/PNG/#11IDAT
+                if self.colormap and not self.plte:
+                    warnings.warn("PLTE chunk is required before IDAT chunk")
+                yield data
+
+        # Decompress a few rows at a time,
+        # so that memory use is proportional to the row size,
+        # not the size of the IDAT chunks.
+        blocks = decompress(iteridat(),
+                            max_length=DECOMPRESS_ROWS * (self.row_bytes + 1),
+                            limit=self.max_decompressed)
+        if self.threaded:
+            blocks = iter_threaded(blocks, THREAD_QUEUE_BLOCKS)
+        if self._cancel is not None:
+            blocks = self._iter_cancellable(blocks)
+        return blocks
+
+    def _iter_cancellable(self, blocks):
+        """Pass on `blocks`, checking before each one
+        whether decoding has been cancelled."""
+
+        for block in blocks:
+            if self._cancel.is_set():
+                raise Error("Decoding cancelled.")
+            yield block
+
+    def _info(self, width, height):
+        """
+        The *info* dictionary returned by :meth:`read`,
+        for an image of `width` by `height` pixels.
+        """
+
         info = dict()
         for attr in 'greyscale alpha planes bitdepth interlace'.split():
             info[attr] = getattr(self, attr)
-        info['size'] = (self.width, self.height)
+        info['size'] = (width, height)
         for attr in 'gamma transparent background'.split():
             a = getattr(self, attr, None)
             if a is not None:
@@ -1837,7 +3031,65 @@ class Reader:
                                           self.unit_is_meter)
         if self.plte:
             info['palette'] = self.palette()
-        return self.width, self.height, rows, info
+        return info
+
+    def read_passes(self, lenient=False):
+        """
+        Read an interlaced PNG file and decode it progressively.
+        Returns an iterator that yields a
+        (*width*, *height*, *rows*, *info*) tuple
+        (as the :meth:`read` method returns) for
+        each successively finer image:
+        after Adam7 pass 1 (every 8th pixel across and down),
+        after pass 3 (every 4th), after pass 5 (every 2nd),
+        and finally after pass 7 (the whole image).
+        ``info['scale']`` is 8, 4, 2, and 1 respectively, and
+        *width* and *height* are those of the reduced image
+        (``ceil(width / scale)`` by ``ceil(height / scale)``).
+        The reduced images are exactly what :meth:`read` returns
+        when called with the same `scale`.
+
+        Decompression and filtering proceeds only as far
+        as needed for each image,
+        so a caller that has seen enough can stop iterating early and
+        avoid decoding the rest of the file.
+
+        For a straightlaced image there is no short cut;
+        the whole image is yielded, once, with ``info['scale']`` of 1.
+        """
+
+        self.preamble(lenient=lenient)
+
+        if not self.interlace:
+            width, height, rows, info = self.read(lenient=lenient)
+            info['scale'] = 1
+            yield width, height, rows, info
+            return
+
+        arraycode = 'BH'[self.bitdepth > 8]
+        vpr = self.width * self.planes
+        # The scale of the image that is complete after each pass.
+        scales = {0: 8, 2: 4, 4: 2, 6: 1}
+        raw = self._iter_raw(lenient=lenient)
+        for pass_index, values in self._iter_deinterlace(raw):
+            if pass_index not in scales:
+                continue
+            scale = scales[pass_index]
+            width = (self.width + scale - 1) // scale
+            height = (self.height + scale - 1) // scale
+            rows = []
+            for y in range(0, self.height, scale):
+                offset = y * vpr
+                # Start with a slice of the right type and length,
+                # then fill in each plane.
+                row = values[offset: offset + width * self.planes]
+                for i in range(self.planes):
+                    row[i::self.planes] = \
+                        values[offset + i: offset + vpr: scale * self.planes]
+                rows.append(array(arraycode, row))
+            info = self._info(width, height)
+            info['scale'] = scale
+            yield width, height, rows, info
 
     def read_flat(self):
         """
@@ -1852,10 +3104,265 @@ class Reader:
         because it returns a sequence of rows.
         """
 
-        x, y, pixel, info = self.read()
+        self.preamble()
+        arraycode = 'BH'[self.bitdepth > 8]
+        pixel = array(arraycode,
+                      bytes(self.width * self.height * self.planes *
+                            array(arraycode).itemsize))
+        return self.read_into(pixel)
+
+    def read_into(self, buffer, lenient=False):
+        """
+        Read a PNG file and decode it into `buffer`,
+        which can be any writable object that
+        supports the buffer protocol
+        (a ``bytearray``, an ``array``, a NumPy array,
+        the ``buf`` of a ``multiprocessing.shared_memory.SharedMemory``).
+        Returns (*width*, *height*, *buffer*, *info*).
+
+        The values are stored as :meth:`read_flat` stores them:
+        one byte per value for images with a bit depth of 8 or less,
+        otherwise two bytes per value, in native byte order
+        (as an ``array('H')`` or a NumPy ``uint16`` array holds them).
+        `buffer` must be contiguous and
+        exactly the size of the image;
+        otherwise :class:`ProtocolError` is raised.
+
+        For a straightlaced image with a bit depth of 8 or 16,
+        each row is reconstructed in its place in `buffer`,
+        with no intermediate copies.
+        """
+
+        self.preamble(lenient=lenient)
+        try:
+            out = memoryview(buffer)
+        except TypeError:
+            raise ProtocolError("read_into needs a buffer, not %r" % buffer)
+        if out.readonly:
+            raise ProtocolError("read_into needs a writable buffer")
+        if not out.c_contiguous:
+            raise ProtocolError("read_into needs a contiguous buffer")
+        out = out.cast('B')
+        vpr = self.width * self.planes
+        size = vpr * self.height * (1 + (self.bitdepth > 8))
+        if len(out) != size:
+            raise ProtocolError(
+                "buffer of %d bytes given for an image of %d bytes"
+                % (len(out), size))
+
+        raw = self._iter_raw(lenient=lenient)
+        if self.interlace:
+            for _ in self._iter_deinterlace(raw, out=out):
+                pass
+        elif self.bitdepth >= 8:
+            for _ in self._iter_straight_packed(raw, out=out):
+                pass
+            if self.bitdepth == 16 and sys.byteorder == 'little':
+                # PNG is big-endian.
+                if numpy is not None:
+                    numpy.frombuffer(out, numpy.uint16).byteswap(inplace=True)
+                else:
+                    out[0::2], out[1::2] = bytes(out[1::2]), bytes(out[0::2])
+        else:
+            table = unpack_tables[self.bitdepth]
+            rows = self._iter_straight_packed(
+                raw, buffers=self.buffers or RowBuffers())
+            for y, row in enumerate(rows):
+                out[y * vpr: (y + 1) * vpr] = \
+                    b''.join(map(table.__getitem__, row))[:vpr]
+        return self.width, self.height, buffer, self._info(
+            self.width, self.height)
+
+    def read_planes(self, use_numpy=False):
+        """
+        Read a PNG file and decode it into one array per channel.
+        Returns (*width*, *height*, *planes*, *info*).
+
+        The pixel values are those of :meth:`asDirect`,
+        so palettes and transparency have already been resolved.
+
+        *planes* is a tuple with one element per channel
+        (R, G, B for an RGB image; L, A for a greyscale--alpha image;
+        and so on).
+        Each element is a single ``array`` holding
+        ``width * height`` values,
+        the top row first, and each row from left to right.
+        If `use_numpy` is true
+        (which requires ``numpy``)
+        each element is instead a ``numpy`` array of shape
+        ``(height, width)``.
+
+        The channels are separated from each row
+        with strided slices,
+        without visiting each value in Python.
+        An interlaced image that needs no conversion
+        is deinterlaced straight into the planes.
+        """
+
+        self.preamble()
+        if self.interlace and not (
+                self.colormap or self.trns or self.sbit):
+            return self._read_planes_interlaced(use_numpy)
+
+        width, height, pixels, info = self.asDirect()
+        planes = info['planes']
         arraycode = 'BH'[info['bitdepth'] > 8]
-        pixel = array(arraycode, itertools.chain(*pixel))
-        return x, y, pixel, info
+
+        if use_numpy:
+            if numpy is None:
+                raise ProtocolError("use_numpy requires numpy")
+            dtype = (numpy.uint8, numpy.uint16)[info['bitdepth'] > 8]
+            out = numpy.empty((planes, height, width), dtype=dtype)
+            for y, row in enumerate(pixels):
+                row = numpy.asarray(row, dtype=dtype).reshape(width, planes)
+                out[:, y, :] = row.T
+            return width, height, tuple(out), info
+
+        result = tuple(array(arraycode, bytes(width * height *
+                                              (1, 2)[arraycode == 'H']))
+                       for _ in range(planes))
+        views = [memoryview(plane) for plane in result]
+        offset = 0
+        for row in pixels:
+            if not isinstance(row, (bytearray, array)):
+                row = array(arraycode, row)
+            for i in range(planes):
+                views[i][offset: offset + width] = row[i::planes]
+            offset += width
+        for view in views:
+            view.release()
+        return width, height, result, info
+
+    def _read_planes_interlaced(self, use_numpy):
+        """Helper used by :meth:`read_planes`."""
+
+        if use_numpy and numpy is None:
+            raise ProtocolError("use_numpy requires numpy")
+        for _, values in self._iter_deinterlace(
+                self._iter_raw(), planar=True):
+            pass
+        width, height, planes = self.width, self.height, self.planes
+        info = self._info(width, height)
+        if use_numpy:
+            dtype = (numpy.uint8, numpy.uint16)[self.bitdepth > 8]
+            values = numpy.frombuffer(values, dtype=dtype)
+            return width, height, tuple(
+                values.reshape(planes, height, width)), info
+        arraycode = 'BH'[self.bitdepth > 8]
+        n = width * height
+        return width, height, tuple(
+            array(arraycode, values[i * n: (i + 1) * n])
+            for i in range(planes)), info
+
+    def read_luma(self, use_numpy=False, scale=1, average=False):
+        """
+        Read a PNG file and decode it into a single plane of
+        8-bit luma (greyscale) values.
+        Returns (*width*, *height*, *luma*, *info*).
+
+        For each pixel the luma is
+        ``round(0.299 * R + 0.587 * G + 0.114 * B)``,
+        where R, G, B are the values that :meth:`asRGB8`
+        (or :meth:`asRGBA8`) would return;
+        for greyscale images it is that same 8-bit grey value.
+        Palettes and ``sBIT`` chunks are taken into account;
+        alpha channels and ``tRNS`` chunks are ignored.
+
+        Each row is converted as soon as it is decoded,
+        so only the luma plane is ever held in memory.
+
+        *luma* is a single ``array`` holding ``width * height`` values,
+        the top row first, and each row from left to right.
+        If `use_numpy` is true
+        (which requires ``numpy``)
+        it is instead a ``numpy`` array of shape ``(height, width)``.
+
+        `scale` and `average` reduce the image
+        as they do for the :meth:`read` method.
+
+        *info* describes the result: an 8-bit greyscale image.
+        """
+
+        if use_numpy and numpy is None:
+            raise ProtocolError("use_numpy requires numpy")
+
+        width, height, pixels, info = self.read(scale=scale, average=average)
+
+        # Table, indexed by source value, of the 8-bit value;
+        # see the :meth:`asDirect` and :meth:`_as_rescale` methods.
+        depth = (self.bitdepth, 8)[self.colormap]
+        shift = 0
+        if self.sbit:
+            sbit = struct.unpack('%dB' % len(self.sbit), self.sbit)
+            if max(sbit) > depth:
+                raise Error('sBIT chunk %r exceeds bitdepth %d' %
+                            (sbit, self.bitdepth))
+            if min(sbit) <= 0:
+                raise Error('sBIT chunk %r has a 0-entry' % sbit)
+            shift = depth - max(sbit)
+        factor = 255.0 / (2 ** (depth - shift) - 1)
+        to8 = [int(round((v >> shift) * factor)) for v in range(2 ** depth)]
+
+        planes = self.planes
+        if self.colormap or self.greyscale:
+            if self.colormap:
+                lut = [round(0.299 * to8[p[0]] +
+                             0.587 * to8[p[1]] +
+                             0.114 * to8[p[2]])
+                       for p in self.palette()]
+                lut.extend([0] * (256 - len(lut)))
+            else:
+                lut = to8
+            if use_numpy:
+                lut = numpy.array(lut, dtype=numpy.uint8)
+
+                def convert(row):
+                    return lut[numpy.asarray(row)[::planes]]
+            elif len(lut) <= 256:
+                lut = bytes(lut) + bytes(256 - len(lut))
+
+                def convert(row):
+                    return bytes(row[::planes]).translate(lut)
+            else:
+                def convert(row):
+                    return bytearray(map(lut.__getitem__, row[::planes]))
+        else:
+            lr, lg, lb = [[w * v for v in to8] for w in (0.299, 0.587, 0.114)]
+            if use_numpy:
+                lr, lg, lb = (numpy.array(t) for t in (lr, lg, lb))
+
+                def convert(row):
+                    row = numpy.asarray(row).reshape(width, planes)
+                    return numpy.rint(lr[row[:, 0]] +
+                                      lg[row[:, 1]] +
+                                      lb[row[:, 2]])
+            else:
+                def convert(row):
+                    return bytearray(
+                        round(lr[r] + lg[g] + lb[b])
+                        for r, g, b in zip(row[0::planes],
+                                           row[1::planes],
+                                           row[2::planes]))
+
+        if use_numpy:
+            luma = numpy.empty((height, width), dtype=numpy.uint8)
+            for y, row in enumerate(pixels):
+                luma[y] = convert(row)
+        else:
+            luma = array('B', bytes(width * height))
+            view = memoryview(luma)
+            offset = 0
+            for row in pixels:
+                view[offset: offset + width] = convert(row)
+                offset += width
+            view.release()
+
+        info = dict(info, greyscale=True, alpha=False,
+                    planes=1, bitdepth=8)
+        info.pop('transparent', None)
+        info.pop('background', None)
+        info.pop('palette', None)
+        return width, height, luma, info
 
     def palette(self, alpha='natural'):
         """
@@ -1884,7 +3391,7 @@ class Reader:
             plte = list(map(operator.add, plte, group(trns, 1)))
         return plte
 
-    def asDirect(self):
+    def asDirect(self, bitdepth=None):
         """
         Returns the image data as a direct representation of
         an ``x * y * planes`` array.
@@ -1927,13 +3434,23 @@ class Reader:
         (like the :meth:`read` method).
 
         All the other aspects of the image data are not changed.
+
+        If `bitdepth` is given,
+        the values are finally rescaled to that bit depth
+        (this is how :meth:`asRGB8` and :meth:`asRGBA8` work).
+        For a 16-bit image with neither a ``tRNS`` nor an ``sBIT`` chunk
+        and a `bitdepth` of 8,
+        the values are converted as they are unpacked.
         """
 
         self.preamble()
 
         # Simple case, no conversion necessary.
         if not self.colormap and not self.trns and not self.sbit:
-            return self.read()
+            if bitdepth == 8 and self.bitdepth == 16:
+                return self.read(bitdepth=8)
+            x, y, pixels, info = self.read()
+            return self._rescaled(x, y, pixels, info, bitdepth)
 
         x, y, pixels, info = self.read()
 
@@ -1944,10 +3461,21 @@ class Reader:
             info['planes'] = 3 + bool(self.trns)
             plte = self.palette()
 
+            # One table per channel, for ``bytes.translate``.
+            # (Indexes are never more than 8-bit, and
+            # this is quicker than indexing a numpy array.)
+            n = len(plte[0])
+            tables = [bytes(p[i] for p in plte).ljust(256, b'\0')
+                      for i in range(n)]
+
             def iterpal(pixels):
                 for row in pixels:
-                    row = [plte[x] for x in row]
-                    yield array('B', itertools.chain(*row))
+                    row = bytes(row)
+                    check_palette_indexes(row, plte)
+                    a = bytearray(len(row) * n)
+                    for i, table in enumerate(tables):
+                        a[i::n] = row.translate(table)
+                    yield array('B', a)
             pixels = iterpal(pixels)
         elif self.trns:
             # It would be nice if there was some reasonable way
@@ -1964,6 +3492,7 @@ class Reader:
             info['planes'] += 1
             typecode = 'BH'[info['bitdepth'] > 8]
 
+            # The general case, replaced below when possible.
             def itertrns(pixels):
                 for row in pixels:
                     # For each row we group it into pixels, then form a
@@ -1978,6 +3507,38 @@ class Reader:
                     yield array(
                         typecode,
                         itertools.chain(*map(operator.add, row, opa)))
+
+            if typecode == 'B':
+                # For each channel, a table that maps
+                # the transparent value to 1 and everything else to 0.
+                tables = [bytes(v == t for v in range(256)) for t in it]
+                alpha = bytes([maxval, 0]) + bytes(254)
+
+                def itertrns(pixels):
+                    for row in pixels:
+                        row = bytes(row)
+                        n = len(row) // planes
+                        # A pixel is transparent when every channel
+                        # matches; the AND is done on the whole row at once
+                        # with each row of 0/1 bytes as a single integer.
+                        matches = -1
+                        for i, table in enumerate(tables):
+                            matches &= int.from_bytes(
+                                row[i::planes].translate(table), 'big')
+                        a = bytearray(n * (planes + 1))
+                        for i in range(planes):
+                            a[i::planes + 1] = row[i::planes]
+                        a[planes::planes + 1] = \
+                            matches.to_bytes(n, 'big').translate(alpha)
+                        yield array('B', a)
+            elif numpy is not None:
+                def itertrns(pixels):
+                    for row in pixels:
+                        row = numpy.asarray(row).reshape(-1, planes)
+                        a = numpy.empty((len(row), planes + 1), row.dtype)
+                        a[:, :planes] = row
+                        a[:, planes] = (row != it).any(axis=1) * maxval
+                        yield array(typecode, a.tobytes())
             pixels = itertrns(pixels)
         targetbitdepth = None
         if self.sbit:
@@ -1992,28 +3553,42 @@ class Reader:
             shift = info['bitdepth'] - targetbitdepth
             info['bitdepth'] = targetbitdepth
 
+            # The general case, replaced below when possible.
             def itershift(pixels):
                 for row in pixels:
                     yield [p >> shift for p in row]
+
+            if self.bitdepth <= 8 or self.colormap:
+                table = bytes(v >> shift for v in range(256))
+
+                def itershift(pixels):
+                    for row in pixels:
+                        yield array('B', bytes(row).translate(table))
+            elif numpy is not None:
+                def itershift(pixels):
+                    for row in pixels:
+                        row = numpy.asarray(row) >> shift
+                        yield array('H', row.tobytes())
             pixels = itershift(pixels)
-        return x, y, pixels, info
+        return self._rescaled(x, y, pixels, info, bitdepth)
+
+    def _rescaled(self, width, height, pixels, info, bitdepth):
+        """
+        Helper used by :meth:`asDirect`;
+        rescale `pixels` to `bitdepth` (if that is not ``None``),
+        updating `info`.
+        """
+
+        if bitdepth is None or bitdepth == info['bitdepth']:
+            return width, height, pixels, info
+        pixels = iter_rescale(pixels, info['bitdepth'], bitdepth)
+        info['bitdepth'] = bitdepth
+        return width, height, pixels, info
 
     def _as_rescale(self, get, targetbitdepth):
         """Helper used by :meth:`asRGB8` and :meth:`asRGBA8`."""
 
-        width, height, pixels, info = get()
-        maxval = 2**info['bitdepth'] - 1
-        targetmaxval = 2**targetbitdepth - 1
-        factor = float(targetmaxval) / float(maxval)
-        info['bitdepth'] = targetbitdepth
-
-        def iterscale():
-            for row in pixels:
-                yield [int(round(x * factor)) for x in row]
-        if maxval == targetmaxval:
-            return width, height, pixels, info
-        else:
-            return width, height, iterscale(), info
+        return get(bitdepth=targetbitdepth)
 
     def asRGB8(self):
         """
@@ -2050,7 +3625,7 @@ class Reader:
 
         return self._as_rescale(self.asRGBA, 8)
 
-    def asRGB(self):
+    def asRGB(self, bitdepth=None):
         """
         Return image as RGB pixels.
         RGB colour images are passed through unchanged;
@@ -2063,9 +3638,11 @@ class Reader:
         the *info* reflect the returned pixels, not the source image.
         In particular,
         for this method ``info['greyscale']`` will be ``False``.
+
+        `bitdepth` is as for the :meth:`asDirect` method.
         """
 
-        width, height, pixels, info = self.asDirect()
+        width, height, pixels, info = self.asDirect(bitdepth=bitdepth)
         if info['alpha']:
             raise Error("will not convert image with alpha channel to RGB")
         if not info['greyscale']:
@@ -2088,7 +3665,7 @@ class Reader:
                 yield a
         return width, height, iterrgb(), info
 
-    def asRGBA(self):
+    def asRGBA(self, bitdepth=None):
         """
         Return image as RGBA pixels.
         Greyscales are expanded into RGB triplets;
@@ -2098,9 +3675,11 @@ class Reader:
         In particular, for this method
         ``info['greyscale']`` will be ``False``, and
         ``info['alpha']`` will be ``True``.
+
+        `bitdepth` is as for the :meth:`asDirect` method.
         """
 
-        width, height, pixels, info = self.asDirect()
+        width, height, pixels, info = self.asDirect(bitdepth=bitdepth)
         if info['alpha'] and not info['greyscale']:
             return width, height, pixels, info
         typecode = 'BH'[info['bitdepth'] > 8]
@@ -2146,23 +3725,338 @@ class Reader:
         return width, height, convert(), info
 
 
-def decompress(data_blocks):
+# The number of rows that :meth:`Reader.read` asks
+# :func:`decompress` for at a time.
+DECOMPRESS_ROWS = 8
+
+# The number of rows whose filters are undone together,
+# when numpy is available (see :func:`undo_filters_numpy`).
+UNFILTER_ROWS = 256
+
+
+def decompress(data_blocks, max_length=0, limit=None):
     """
     `data_blocks` should be an iterable that
     yields the compressed data (from the ``IDAT`` chunks).
     This yields decompressed byte strings.
+
+    If `max_length` is given (and not 0),
+    no yielded byte string is longer than `max_length`
+    (apart from the final one, which holds whatever
+    was still buffered in the decompressor, and is small);
+    otherwise there is one yield per block of `data_blocks`.
+
+    If `limit` is given, :class:`LimitError` is raised as soon as
+    more than `limit` bytes have been decompressed.
     """
 
-    # Currently, with no max_length parameter to decompress,
-    # this routine will do one yield per IDAT chunk: Not very
-    # incremental.
     d = zlib.decompressobj()
+    total = 0
+
+    def check(n):
+        if limit is not None and n > limit:
+            raise LimitError(
+                "Decompressed IDAT data exceeds the limit of %d bytes."
+                % limit)
+
     # Each IDAT chunk is passed to the decompressor, then any
     # remaining state is decompressed out.
     for data in data_blocks:
-        # :todo: add a max_length argument here to limit output size.
-        yield bytearray(d.decompress(data))
-    yield bytearray(d.flush())
+        while True:
+            out = d.decompress(data, max_length)
+            data = d.unconsumed_tail
+            total += len(out)
+            check(total)
+            if out:
+                yield bytearray(out)
+            if not data:
+                break
+    out = d.flush()
+    total += len(out)
+    check(total)
+    yield bytearray(out)
+
+
+# The number of decompressed blocks that
+# the background thread of a threaded Reader can get ahead by.
+THREAD_QUEUE_BLOCKS = 16
+
+
+def iter_threaded(iterable, maxsize=0):
+    """
+    Iterate over `iterable` on a background thread,
+    yielding its items (in the calling thread) through a queue
+    that holds at most `maxsize` items (0 for no limit).
+
+    An exception raised by `iterable` is raised again
+    in the calling thread.
+    If this iterator is closed before the end,
+    the background thread stops at its next item.
+    """
+
+    items = queue.Queue(maxsize)
+    stop = threading.Event()
+    # Marks the end of the items;
+    # paired with the exception, if any, that ended them.
+    end = object()
+
+    def put(item):
+        """Queue `item`;
+        return False if stopped whilst waiting for space."""
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.05)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def run():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+        except BaseException as e:
+            put((end, e))
+        else:
+            put((end, None))
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            item, error = items.get()
+            if item is end:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def probe(source):
+    """
+    Read only the signature and the ``IHDR`` chunk of a PNG file, and
+    return a (*width*, *height*, *bitdepth*, *color_type*, *interlace*)
+    named tuple.
+
+    `source` is a filename (a ``str`` or path-like object),
+    a file-like object, or
+    a buffer (``bytes``, ``bytearray``, and so on) holding the PNG data.
+    A file-like object is left just after the ``IHDR`` chunk.
+    """
+
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as file:
+            return probe(file)
+    if hasattr(source, 'read'):
+        reader = Reader(file=source)
+    else:
+        reader = Reader(bytes=source, zero_copy=True)
+    reader.validate_signature()
+    reader.atchunk = reader._chunk_len_type()
+    if reader.atchunk is None or reader.atchunk[1] != b'IHDR':
+        raise FormatError('PNG file does not start with an IHDR chunk.')
+    reader.process_chunk()
+    return Header(reader.width, reader.height, reader.bitdepth,
+                  reader.color_type, reader.interlace)
+
+
+# The methods of Reader that async_read and iter_stream can use,
+# for each mode.
+# In 'rows' mode the rows are those of asDirect, in a list.
+read_modes = dict(
+    planes=lambda reader: reader.read_planes(),
+    flat=lambda reader: reader.read_flat(),
+    luma=lambda reader: reader.read_luma(),
+    rows=lambda reader: _list_rows(*reader.asDirect()),
+)
+
+
+def _list_rows(width, height, rows, info):
+    return width, height, list(rows), info
+
+
+async def async_read(source, mode='planes', semaphore=None, executor=None):
+    """
+    Decode a PNG file without blocking the ``asyncio`` event loop.
+    Returns (*width*, *height*, *pixels*, *info*).
+
+    `source` is a filename (or path-like object), a file-like object,
+    or a buffer holding the PNG data.
+    The file is opened, read, and decompressed in `executor`
+    (the event loop's default executor if it is ``None``).
+
+    `mode` selects what *pixels* is:
+    ``'planes'`` for the planes of :meth:`Reader.read_planes`;
+    ``'flat'`` for the single array of :meth:`Reader.read_flat`;
+    ``'luma'`` for the luma plane of :meth:`Reader.read_luma`;
+    ``'rows'`` for a list of the rows of :meth:`Reader.asDirect`.
+
+    If `semaphore` (an ``asyncio.Semaphore``) is given,
+    it is held whilst the image is decoded,
+    which limits how many images are decoded at once.
+
+    If the task is cancelled,
+    decoding stops at the next block of data;
+    the semaphore is only released once the executor has stopped,
+    so that cancelled decodes do not count against the limit
+    whilst still running.
+    """
+
+    if mode not in read_modes:
+        raise ProtocolError("mode must be one of %s, not %r"
+                            % (', '.join(sorted(read_modes)), mode))
+    if semaphore is not None:
+        async with semaphore:
+            return await async_read(source, mode, executor=executor)
+
+    cancel = threading.Event()
+
+    def decode():
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, 'rb') as file:
+                return decode_reader(Reader(file=file))
+        if hasattr(source, 'read'):
+            return decode_reader(Reader(file=source))
+        return decode_reader(Reader(bytes=source))
+
+    def decode_reader(reader):
+        reader._cancel = cancel
+        return read_modes[mode](reader)
+
+    future = asyncio.get_running_loop().run_in_executor(executor, decode)
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        cancel.set()
+        # Wait for the decode to stop; it fails with Error,
+        # which is retrieved here so that it is not reported.
+        await asyncio.wait([future])
+        if not future.cancelled():
+            future.exception()
+        raise
+
+
+async def async_read_all(sources, mode='planes', concurrency=4,
+                         executor=None):
+    """
+    Decode each PNG file in `sources`
+    (as for :func:`async_read`),
+    with at most `concurrency` of them being decoded at once.
+    Returns a list of the results, in the same order as `sources`.
+
+    If any of them fails, or this is cancelled,
+    the others are cancelled.
+    """
+
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = [asyncio.ensure_future(
+        async_read(source, mode, semaphore=semaphore, executor=executor))
+        for source in sources]
+    try:
+        return await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def iter_stream(file, mode='flat'):
+    """
+    Decode a stream of PNG files that follow each other
+    with nothing in between
+    (as a camera might write them to a pipe),
+    yielding (*width*, *height*, *pixels*, *info*) for each one.
+    `mode` selects what *pixels* is, as for :func:`async_read`.
+
+    `file` is only read forwards, so it can be
+    ``sys.stdin`` (see :func:`binary_stdin`), a pipe, or a socket;
+    an unbuffered stream is wrapped in an ``io.BufferedReader``.
+    Each image is read up to and including its ``IEND`` chunk;
+    the stream ends when there is no data where
+    the next signature would be.
+    """
+
+    if mode not in read_modes:
+        raise ProtocolError("mode must be one of %s, not %r"
+                            % (', '.join(sorted(read_modes)), mode))
+    if isinstance(file, io.RawIOBase):
+        file = io.BufferedReader(file)
+    while True:
+        first = file.read(8)
+        if not first:
+            return
+        if first != signature:
+            raise FormatError("PNG file has invalid signature.")
+        reader = Reader(file=file)
+        # The signature has already been read and checked.
+        reader.signature = first
+        position = reader._tell()
+        if position is not None:
+            reader.start = position - len(signature)
+        result = read_modes[mode](reader)
+        # Interlaced images can be decoded without reading
+        # as far as IEND.
+        while not reader._iend:
+            reader.chunk()
+        yield result
+
+
+def rescale_table(bitdepth, targetbitdepth):
+    """
+    Return a list that maps each value of `bitdepth` bits to
+    the nearest value of `targetbitdepth` bits
+    (scaling so that the maximum maps to the maximum).
+    """
+
+    key = (bitdepth, targetbitdepth)
+    if key not in rescale_tables:
+        factor = float(2 ** targetbitdepth - 1) / float(2 ** bitdepth - 1)
+        rescale_tables[key] = [int(round(x * factor))
+                               for x in range(2 ** bitdepth)]
+    return rescale_tables[key]
+
+
+# Cache of the tables made by rescale_table.
+rescale_tables = {}
+
+
+def iter_rescale(rows, bitdepth, targetbitdepth):
+    """
+    Take each row in rows (an iterator) of `bitdepth` values and
+    yield a fresh row of `targetbitdepth` values,
+    each looked up in a :func:`rescale_table`.
+    """
+
+    table = rescale_table(bitdepth, targetbitdepth)
+    typecode = 'BH'[targetbitdepth > 8]
+
+    if bitdepth <= 8 and targetbitdepth <= 8:
+        table = bytes(table).ljust(256, b'\0')
+        for row in rows:
+            yield array('B', bytes(row).translate(table))
+    elif numpy is not None:
+        table = numpy.array(table, dtype=typecode)
+        for row in rows:
+            yield array(typecode, table[numpy.asarray(row)].tobytes())
+    else:
+        for row in rows:
+            yield array(typecode, map(table.__getitem__, row))
+
+
+def check_palette_indexes(row, palette):
+    """
+    Check that every value in `row` is a valid index into `palette`.
+    """
+
+    if len(row) and max(row) >= len(palette):
+        raise FormatError(
+            "Palette index %d is out of range; the palette has %d entries."
+            % (max(row), len(palette)))
 
 
 def check_bitdepth_colortype(bitdepth, colortype):
@@ -2267,6 +4161,170 @@ def undo_filter_paeth(filter_unit, scanline, previous, result):
         ai += 1
 
 
+# The following are alternatives to the undo_filter_* functions
+# above that use numpy;
+# they must give byte for byte the same results.
+# `result` must be a writable buffer (a ``bytearray``),
+# and its length must be a multiple of `filter_unit`.
+
+def undo_filter_sub_numpy(filter_unit, scanline, previous, result):
+    """Undo sub filter, using numpy."""
+
+    # Each byte only depends on the byte one filter unit to its left,
+    # so viewing the row as one column per byte of the pixel,
+    # the filter is undone with a running sum down each column.
+    r = numpy.frombuffer(result, dtype=numpy.uint8).reshape(-1, filter_unit)
+    numpy.add.accumulate(r, axis=0, dtype=numpy.uint8, out=r)
+
+
+def undo_filter_up_numpy(filter_unit, scanline, previous, result):
+    """Undo up filter, using numpy."""
+
+    r = numpy.frombuffer(result, dtype=numpy.uint8)
+    b = numpy.frombuffer(previous, dtype=numpy.uint8)
+    numpy.add(r, b, out=r)
+
+
+def undo_filter_paeth_numpy(filter_unit, scanline, previous, result):
+    """Undo Paeth filter, using numpy.
+    The predictor for each byte depends on the
+    reconstructed byte to its left, so that part remains a loop;
+    everything that only depends on the previous line
+    is computed for the whole row beforehand.
+    """
+
+    b = numpy.frombuffer(previous, dtype=numpy.uint8).astype(numpy.int16)
+    c = numpy.zeros_like(b)
+    c[filter_unit:] = b[:-filter_unit]
+    # With p = a + b - c, and d = b - c:
+    # p - a is d; p - b is a - c; p - c is (a - c) + d.
+    d = b - c
+    pa = numpy.abs(d).tolist()
+    d = d.tolist()
+    b = b.tolist()
+    c = c.tolist()
+
+    ai = -filter_unit
+    for i in range(len(result)):
+        if ai < 0:
+            a = 0
+        else:
+            a = result[ai]
+        ci = c[i]
+        t = a - ci
+        pb = t if t >= 0 else -t
+        t += d[i]
+        pc = t if t >= 0 else -t
+        if pa[i] <= pb and pa[i] <= pc:
+            pr = a
+        elif pb <= pc:
+            pr = b[i]
+        else:
+            pr = ci
+        result[i] = (scanline[i] + pr) & 0xff
+        ai += 1
+
+
+def undo_filters_numpy(filter_unit, raw, row_size, previous=None):
+    """Undo the filters of several consecutive scanlines, using numpy.
+    `raw` holds the scanlines one after another,
+    each with its filter type byte first;
+    `previous` is the reconstructed scanline before them,
+    or ``None`` if they start the image (or an interlace pass).
+    The result is a ``numpy.uint8`` array
+    with one row per scanline.
+
+    The Average and Paeth predictors of a byte depend on the
+    reconstructed byte to its left, and on the byte above it,
+    so pixels on the same anti-diagonal (one pixel to the left
+    for each row further down) do not depend on each other.
+    The scanlines are skewed so that each anti-diagonal is
+    one column, and the columns are reconstructed in turn,
+    each with a handful of whole-column operations.
+    """
+
+    rows = len(raw) // (row_size + 1)
+    lines = numpy.frombuffer(raw, dtype=numpy.uint8)
+    lines = lines.reshape(rows, row_size + 1)
+    filter_types = lines[:, 0]
+    result = lines[:, 1:].copy()
+    if rows and filter_types.max() > 4:
+        raise FormatError(
+            'Invalid PNG Filter Type.  '
+            'See http://www.w3.org/TR/2003/REC-PNG-20031110/#9Filters .')
+    if previous is None:
+        previous = numpy.zeros(row_size, dtype=numpy.uint8)
+    else:
+        previous = numpy.frombuffer(previous, dtype=numpy.uint8)
+
+    if not (filter_types >= 3).any():
+        # Sub and Up are whole-row operations already.
+        for y in range(rows):
+            if filter_types[y] == 1:
+                r = result[y].reshape(-1, filter_unit)
+                numpy.add.accumulate(r, axis=0, dtype=numpy.uint8, out=r)
+            elif filter_types[y] == 2:
+                result[y] += previous
+            previous = result[y]
+        return result
+
+    # Pixels per row.
+    width = row_size // filter_unit
+    # Pixel x of row y is in column x + y + 2 of `skewed`
+    # (and of `filtered`), and in row y + 1;
+    # row 0 of `skewed` holds the previous scanline,
+    # and the columns left of each row are zero.
+    # Columns come first, so that each column is contiguous.
+    skewed = numpy.zeros(
+        (width + rows + 1, rows + 1, filter_unit), dtype=numpy.int16)
+    skewed[1:width + 1, 0] = previous.reshape(width, filter_unit)
+    filtered = numpy.zeros(
+        (width + rows + 1, rows, filter_unit), dtype=numpy.int16)
+    for y in range(rows):
+        filtered[y + 2:y + 2 + width, y] = \
+            result[y].reshape(width, filter_unit)
+    # For each filter type used, which rows use it.
+    uses = [(filter_type, (filter_types == filter_type).reshape(rows, 1))
+            for filter_type in range(5) if (filter_types == filter_type).any()]
+
+    for column in range(2, width + rows + 1):
+        # The rows that have a pixel in this column.
+        first = max(0, column - 1 - width)
+        last = min(rows, column - 1)
+        a = skewed[column - 1, first + 1:last + 1]
+        b = skewed[column - 1, first:last]
+        c = skewed[column - 2, first:last]
+        predictor = None
+        for filter_type, use in uses:
+            if filter_type == 0:
+                p = 0
+            elif filter_type == 1:
+                p = a
+            elif filter_type == 2:
+                p = b
+            elif filter_type == 3:
+                p = (a + b) >> 1
+            else:
+                # With p = a + b - c:
+                # p - a is b - c; p - b is a - c;
+                # p - c is (a - c) + (b - c).
+                pa = numpy.abs(b - c)
+                pb = numpy.abs(a - c)
+                pc = numpy.abs(a + b - 2 * c)
+                p = numpy.where((pa <= pb) & (pa <= pc), a,
+                                numpy.where(pb <= pc, b, c))
+            if predictor is None:
+                predictor = p
+            else:
+                predictor = numpy.where(use[first:last], p, predictor)
+        skewed[column, first + 1:last + 1] = \
+            (filtered[column, first:last] + predictor) & 0xff
+
+    for y in range(rows):
+        result[y] = skewed[y + 2:y + 2 + width, y + 1].reshape(-1)
+    return result
+
+
 def convert_la_to_rgba(row, result):
     for i in range(3):
         result[i::4] = row[0::2]
@@ -0,0 +1,671 @@
+"""
+Tests for the :mod:`png` module.
+
+Run with ``python -m pytest`` (or ``python -m unittest``)
+from the top directory of the repository.
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import io
+import os
+import itertools
+import pathlib
+import random
+import struct
+import tempfile
+import threading
+import unittest
+import zlib
+from unittest import mock
+
+from imageIO import png
+
+
+def make_png(width, height, **kwargs):
+    """A greyscale PNG file, as bytes,
+    of `width` by `height` pixels with varied values."""
+
+    rows = [[(x * 7 + y * 13) % 256 for x in range(width)]
+            for y in range(height)]
+    out = io.BytesIO()
+    png.Writer(width, height, greyscale=True, **kwargs).write(out, rows)
+    return out.getvalue(), rows
+
+
+@contextlib.contextmanager
+def numpy_used(use):
+    """Run the block with the :mod:`png` module using numpy
+    (if it is installed) or, if `use` is false, not using it."""
+
+    saved = png.numpy
+    if not use:
+        png.numpy = None
+    try:
+        yield
+    finally:
+        png.numpy = saved
+
+
+class TestRowBuffers(unittest.TestCase):
+    def test_reuse_abandoned(self):
+        """A RowBuffers pool can be passed on to a new Reader
+        while the rows of the previous Reader are only partly read."""
+
+        d1, _ = make_png(40, 30)
+        d3, rows3 = make_png(17, 9)
+        buffers = png.RowBuffers()
+        abandoned = png.Reader(bytes=d1, buffers=buffers).read()[2]
+        next(abandoned)
+        _, _, rows, _ = png.Reader(bytes=d3, buffers=buffers).read()
+        self.assertEqual([list(row) for row in rows], rows3)
+
+    def test_matches_default(self):
+        """Reading with a RowBuffers pool gives the same rows as
+        reading without one, and every row is one of the pool's
+        two buffers, rather than a new object."""
+
+        buffers = png.RowBuffers()
+        for filter_type, use_numpy in itertools.product(
+                (0, 1, 2, 3, 4, 'adaptive'), (True, False)):
+            with self.subTest(filter_type=filter_type, numpy=use_numpy), \
+                    numpy_used(use_numpy):
+                # Taller than one batch of UNFILTER_ROWS rows.
+                data, expected = make_png(
+                    40, png.UNFILTER_ROWS + 44, filter_type=filter_type)
+                _, _, rows, _ = png.Reader(
+                    bytes=data, buffers=buffers).read()
+                got = []
+                for row in rows:
+                    self.assertTrue(any(row is buffer
+                                        for buffer in buffers.pair))
+                    got.append(list(row))
+                self.assertEqual(got, expected)
+
+
+def formula_rows(width, height, planes, bitdepth):
+    """Rows of values that vary across the image
+    without being random."""
+
+    m = 2 ** bitdepth - 1
+    return [[(x * 37 + y * 101 + x * y) % (m + 1)
+             for x in range(width * planes)]
+            for y in range(height)]
+
+
+class TestLimits(unittest.TestCase):
+    """The `max_pixels` and `max_decompressed` limits of a Reader,
+    and the `max_length` and `limit` of :func:`png.decompress`."""
+
+    def test_ihdr_limits(self):
+        """Both limits are checked when IHDR is read,
+        before any pixel data."""
+
+        data, _ = make_png(40, 30)
+        for kwargs in (dict(max_pixels=40 * 30 - 1),
+                       dict(max_decompressed=(40 + 1) * 30 - 1)):
+            with self.subTest(**kwargs):
+                reader = png.Reader(bytes=data, **kwargs)
+                with self.assertRaises(png.LimitError):
+                    reader.preamble()
+        for kwargs in (dict(max_pixels=40 * 30),
+                       dict(max_decompressed=(40 + 1) * 30)):
+            with self.subTest(**kwargs):
+                _, _, rows, _ = png.Reader(bytes=data, **kwargs).read()
+                self.assertEqual(len(list(rows)), 30)
+
+    def test_inflate_limit(self):
+        """An IDAT stream that decompresses to more than
+        the size that IHDR declares fails whilst it is inflated."""
+
+        ihdr = struct.pack('!2I5B', 40, 30, 8, 0, 0, 0, 0)
+        idat = zlib.compress(bytes((40 + 1) * 30 * 100))
+        out = io.BytesIO()
+        png.write_chunks(out, [(b'IHDR', ihdr), (b'IDAT', idat), (b'IEND',)])
+        reader = png.Reader(bytes=out.getvalue(),
+                            max_decompressed=(40 + 1) * 30)
+        _, _, rows, _ = reader.read()
+        with self.assertRaises(png.LimitError):
+            list(rows)
+
+    def test_decompress_max_length(self):
+        rng = random.Random(3)
+        raw = bytes(rng.randrange(4) for _ in range(20000))
+        compressed = zlib.compress(raw)
+        # The compressed data in IDAT-like chunks of 1000 bytes.
+        chunks = [compressed[i:i + 1000]
+                  for i in range(0, len(compressed), 1000)]
+        blocks = list(png.decompress(chunks, max_length=100))
+        self.assertEqual(b''.join(blocks), raw)
+        self.assertLessEqual(max(map(len, blocks)), 100)
+        with self.assertRaises(png.LimitError):
+            list(png.decompress(chunks, max_length=100,
+                                limit=len(raw) - 1))
+        self.assertEqual(
+            b''.join(png.decompress(chunks, limit=len(raw))), raw)
+
+
+class TestWriterBaseline(unittest.TestCase):
+    """The default Writer output (no `workers`, `filter_type`,
+    `strategy` or `preset`) must stay byte for byte the same
+    as that of the Writer the repository started with.
+    The SHA-256 digests were made with that Writer."""
+
+    palette = [(i, 255 - i, i // 2) for i in range(256)]
+    cases = [
+        (13, 11, 1, dict(greyscale=True, bitdepth=1),
+         '268f37e2c7e84f63e8068c5bed8b04838097b22078a2db88295cf48985500bec'),
+        (13, 11, 1, dict(greyscale=True, bitdepth=2),
+         'e0ff29d51351b72a345d2689593a5b4861957a6dc1d39b6a5b2d8786b5783826'),
+        (13, 11, 1, dict(greyscale=True, bitdepth=4),
+         'baf42f4a3af2961148fb2c3e200dda68a614ff819f03d0effa9473588cf492c1'),
+        (40, 30, 1, dict(greyscale=True),
+         '62febad8689303295e1594f420f1588d33eab2a4da521a136ff2d2b1084854a4'),
+        (40, 30, 1, dict(greyscale=True, bitdepth=16),
+         '481925cdb2c3bae9c6e403a5e6b38540428dbf5d3151a0e880293dff9f651812'),
+        (40, 30, 3, dict(greyscale=False),
+         'c42b3ccc2a9b361ff0d53fb8ea26cf75d49d1dc34ddd3c762d801c9cefddb1e1'),
+        (40, 30, 4, dict(greyscale=False, alpha=True),
+         'ffc1726382d5b18d5704a6d5e2fa7bfd7c9c7c95ecf6e654747a315efc4b9eca'),
+        (40, 30, 4, dict(greyscale=False, alpha=True, bitdepth=16),
+         '0cc63aa9580663b1289ec887c7e5a73de1c9c0a99e5385c3da38c83432d2e232'),
+        (40, 30, 1, dict(greyscale=True, interlace=True),
+         'b06c624dc098928cd649244476fe4ce561fe53ff400f69c962a72c3b53b5a774'),
+        (40, 30, 3, dict(greyscale=False, interlace=True, compression=9),
+         '2cebfe0bcb9754399fc225deba7eea26c5dfdd61e78aaef4464f2c4f23e4618e'),
+        (40, 30, 3, dict(greyscale=False, chunk_limit=100),
+         '679dd96c390449bfe7246f168ac1b7f087694b4163154820a76631a3df56d47f'),
+        (64, 64, 1, dict(greyscale=True, chunk_limit=1000, compression=1),
+         '25d586f2453a6f892ebcf84ed200b4ab7b3560dd3a36ece6e6e9b9517b46bd76'),
+        (9, 17, 1, dict(palette=palette, bitdepth=8),
+         '8887e134d0c0f535fb5d4d87de8858a004f41215136acb1d2a6c16c4c76dce93'),
+    ]
+
+    def test_default_output(self):
+        for i, (width, height, planes, kwargs, digest) in enumerate(
+                self.cases):
+            with self.subTest(case=i):
+                rows = formula_rows(
+                    width, height, planes, kwargs.get('bitdepth', 8))
+                out = io.BytesIO()
+                png.Writer(width, height, **kwargs).write(out, rows)
+                self.assertEqual(
+                    hashlib.sha256(out.getvalue()).hexdigest(), digest)
+
+
+class TestPackRows(unittest.TestCase):
+    def test_value_too_large(self):
+        """A value that does not fit in the bit depth
+        raises ProtocolError, rather than writing a corrupt file."""
+
+        for use_numpy in (True, False):
+            for bitdepth, rows in itertools.product(
+                    (1, 2, 4), ([[0, 1, 16]], [[0, 1], [1, 300]], [[-1]])):
+                with self.subTest(numpy=use_numpy, bitdepth=bitdepth,
+                                  rows=rows), numpy_used(use_numpy):
+                    writer = png.Writer(len(rows[0]), len(rows),
+                                        greyscale=True, bitdepth=bitdepth)
+                    with self.assertRaises(png.ProtocolError):
+                        writer.write(io.BytesIO(), rows)
+
+    @unittest.skipIf(png.numpy is None, "needs numpy")
+    def test_array_value_too_large(self):
+        a = png.numpy.arange(60, dtype=png.numpy.uint8).reshape(5, 12)
+        with self.assertRaises(png.ProtocolError):
+            png.from_array(a, 'L;4').write(io.BytesIO())
+
+    def test_largest_value(self):
+        for use_numpy in (True, False):
+            for bitdepth in (1, 2, 4):
+                with self.subTest(numpy=use_numpy, bitdepth=bitdepth), \
+                        numpy_used(use_numpy):
+                    rows = [[2 ** bitdepth - 1] * 5, [0] * 5]
+                    out = io.BytesIO()
+                    png.Writer(5, 2, greyscale=True,
+                               bitdepth=bitdepth).write(out, rows)
+                    _, _, got, _ = png.Reader(bytes=out.getvalue()).read()
+                    self.assertEqual([list(row) for row in got], rows)
+
+
+def idat_data(data):
+    """The ``IDAT`` data of the PNG file `data`, joined together,
+    and the number of ``IDAT`` chunks."""
+
+    idats = [content for type, content in png.Reader(bytes=data).chunks()
+             if type == b'IDAT']
+    return b''.join(idats), len(idats)
+
+
+class TestWriterWorkers(unittest.TestCase):
+    """A Writer with `workers` compresses strips of the image
+    on several threads, see :func:`png.compress_strips`."""
+
+    def test_round_trip(self):
+        # (width, height, chunk_limit):
+        # one row; one strip; many more strips than 2 * workers;
+        # and strips that fill the 32 KiB dictionary.
+        cases = [(17, 1, 2 ** 20), (40, 30, 2 ** 20), (40, 30, 50),
+                 (300, 300, 5000)]
+        for (width, height, chunk_limit), workers in itertools.product(
+                cases, (2, 3, 4)):
+            with self.subTest(size=(width, height), chunk_limit=chunk_limit,
+                              workers=workers):
+                rows = formula_rows(width, height, 1, 8)
+                out = io.BytesIO()
+                png.Writer(width, height, greyscale=True,
+                           chunk_limit=chunk_limit,
+                           workers=workers).write(out, rows)
+                data, count = idat_data(out.getvalue())
+                self.assertEqual(
+                    zlib.decompress(data),
+                    b''.join(b'\0' + bytes(row) for row in rows))
+                if chunk_limit < width * height:
+                    self.assertGreater(count, 2 * workers)
+                _, _, got, _ = png.Reader(bytes=out.getvalue()).read()
+                self.assertEqual([list(row) for row in got], rows)
+
+    def test_compress_strips(self):
+        """compress_strips gives a complete zlib stream
+        for no strips, empty strips, and strips of one byte."""
+
+        for strips in ([], [b''], [b'', b'a', b''], [b'a', b'b', b'c'] * 5):
+            with self.subTest(strips=strips):
+                data = b''.join(png.compress_strips(strips, workers=2))
+                self.assertEqual(zlib.decompress(data), b''.join(strips))
+
+
+class TestWriterFilters(unittest.TestCase):
+    """Writing with `filter_type`, `strategy` or `preset`."""
+
+    # Sizes include images whose Adam7 passes are partly empty,
+    # where the filter must still start afresh on each pass.
+    sizes = [(1, 1), (1, 5), (2, 3), (3, 1), (5, 9), (13, 11)]
+
+    def write(self, width, height, rows, **kwargs):
+        out = io.BytesIO()
+        png.Writer(width, height, greyscale=True, **kwargs).write(out, rows)
+        return out.getvalue()
+
+    def test_round_trip(self):
+        for filter_type, interlace, bitdepth in itertools.product(
+                (1, 2, 3, 4, 'adaptive'), (False, True), (1, 8, 16)):
+            for width, height in self.sizes:
+                with self.subTest(filter_type=filter_type,
+                                  interlace=interlace, bitdepth=bitdepth,
+                                  size=(width, height)):
+                    rows = formula_rows(width, height, 1, bitdepth)
+                    outputs = []
+                    for use_numpy in (True, False):
+                        with numpy_used(use_numpy):
+                            outputs.append(self.write(
+                                width, height, rows, bitdepth=bitdepth,
+                                interlace=interlace,
+                                filter_type=filter_type))
+                    # numpy does not change the output.
+                    self.assertEqual(outputs[0], outputs[1])
+                    _, _, got, _ = png.Reader(bytes=outputs[0]).read()
+                    self.assertEqual([list(row) for row in got], rows)
+                    if filter_type != 'adaptive' and not interlace:
+                        data, _ = idat_data(outputs[0])
+                        data = zlib.decompress(data)
+                        row_bytes = len(data) // height
+                        self.assertEqual(
+                            set(data[::row_bytes]), {filter_type})
+
+    def test_strategy_and_preset(self):
+        rows = formula_rows(13, 11, 3, 8)
+        for kwargs in (dict(strategy=zlib.Z_RLE),
+                       dict(strategy=zlib.Z_FILTERED),
+                       dict(preset='mask'), dict(preset='photo')):
+            with self.subTest(**kwargs):
+                out = io.BytesIO()
+                png.Writer(13, 11, greyscale=False, **kwargs).write(out, rows)
+                _, _, got, _ = png.Reader(bytes=out.getvalue()).read()
+                self.assertEqual([list(row) for row in got], rows)
+
+
+@unittest.skipIf(png.numpy is None, "needs numpy")
+class TestFilterScanlineNumpy(unittest.TestCase):
+    def test_matches_pure_python(self):
+        rng = random.Random(2)
+        for filter_type, filter_unit in itertools.product(
+                range(5), (1, 2, 3, 4, 6, 8)):
+            with self.subTest(filter_type=filter_type,
+                              filter_unit=filter_unit):
+                row_size = filter_unit * rng.randint(1, 20)
+                line = bytearray(rng.randrange(256) for _ in range(row_size))
+                previous = rng.choice(
+                    [None, bytearray(rng.randrange(256)
+                                     for _ in range(row_size))])
+                expected = png.filter_scanline(
+                    filter_type, line, filter_unit, previous)
+                with numpy_used(False):
+                    got = png.filter_scanline(
+                        filter_type, line, filter_unit, previous)
+                self.assertEqual(got, expected)
+
+
+@unittest.skipIf(png.numpy is None, "needs numpy")
+class TestUndoFiltersNumpy(unittest.TestCase):
+    def undo_filters(self, filter_unit, raw, row_size, previous):
+        """Undo the filters one scanline at a time,
+        with the pure Python functions."""
+
+        fns = (None, png.undo_filter_sub, png.undo_filter_up,
+               png.undo_filter_average, png.undo_filter_paeth)
+        result = []
+        for i in range(0, len(raw), row_size + 1):
+            filter_type = raw[i]
+            scanline = bytearray(raw[i + 1: i + row_size + 1])
+            if filter_type:
+                fns[filter_type](filter_unit, scanline,
+                                 previous or bytearray(row_size), scanline)
+            result.append(bytes(scanline))
+            previous = scanline
+        return result
+
+    def test_matches_pure_python(self):
+        rng = random.Random(1)
+        for filter_types in ([0, 1, 2, 3, 4], [3], [4], [1, 2], [3, 4]):
+            for filter_unit in (1, 2, 3, 4, 6, 8):
+                width = rng.randint(1, 20)
+                rows = rng.randint(1, 12)
+                row_size = filter_unit * width
+                raw = bytearray()
+                for _ in range(rows):
+                    raw.append(rng.choice(filter_types))
+                    raw.extend(rng.randrange(256) for _ in range(row_size))
+                previous = rng.choice(
+                    [None, bytearray(rng.randrange(256)
+                                     for _ in range(row_size))])
+                got = png.undo_filters_numpy(
+                    filter_unit, raw, row_size, previous)
+                self.assertEqual(
+                    [bytes(row) for row in got],
+                    self.undo_filters(filter_unit, raw, row_size, previous))
+
+    def test_invalid_filter_type(self):
+        with self.assertRaises(png.FormatError):
+            png.undo_filters_numpy(1, b'\x05\x00\x00', 2)
+
+
+class TestAsyncRead(unittest.TestCase):
+    def test_async_read_all(self):
+        """async_read_all gives the same rows as Reader.read."""
+
+        sources = [make_png(width, height)
+                   for width, height in ((5, 4), (17, 9), (40, 30))]
+        results = asyncio.run(png.async_read_all(
+            [data for data, _ in sources], mode='rows'))
+        for (width, height, rows, _), (_, expected) in zip(results, sources):
+            self.assertEqual([list(row) for row in rows], expected)
+
+    def test_path(self):
+        """async_read opens a path-like object, as probe does."""
+
+        data, expected = make_png(17, 9)
+        with tempfile.TemporaryDirectory() as directory:
+            path = pathlib.Path(directory) / 'image.png'
+            path.write_bytes(data)
+            width, height, rows, _ = asyncio.run(
+                png.async_read(path, mode='rows'))
+        self.assertEqual((width, height), (17, 9))
+        self.assertEqual([list(row) for row in rows], expected)
+
+
+class TestProbe(unittest.TestCase):
+    def test_path(self):
+        """probe accepts a path-like object, as Reader does."""
+
+        data, _ = make_png(17, 9)
+        with tempfile.TemporaryDirectory() as directory:
+            path = pathlib.Path(directory) / 'image.png'
+            path.write_bytes(data)
+            self.assertEqual(png.probe(path)[:2], (17, 9))
+
+    def test_chunk_index_after_other_data(self):
+        """chunk_index gives the offsets of a PNG file that starts
+        part way through the file it was given."""
+
+        first, _ = make_png(5, 4)
+        second, _ = make_png(17, 9)
+        file = io.BytesIO(first + second)
+        file.seek(len(first))
+        index = png.Reader(file=file).chunk_index()
+        self.assertEqual(index[0][0], b'IHDR')
+        self.assertEqual(index[0][1], len(first) + 16)
+        self.assertEqual(index[-1][0], b'IEND')
+        # Only the signature has been read, as for decoding.
+        self.assertEqual(file.tell(), len(first) + 8)
+        for type, offset, length in index:
+            self.assertEqual(
+                (first + second)[offset - 4:offset], type)
+
+
+class TestReadRegion(unittest.TestCase):
+    def test_decompresses_only_needed_rows(self):
+        """read_region stops decompressing once the last row
+        of the region is complete, with or without numpy."""
+
+        width, height = 40, png.UNFILTER_ROWS + 100
+        data, rows = make_png(width, height)
+        original = png.decompress
+        for use_numpy in (True, False):
+            with self.subTest(numpy=use_numpy), numpy_used(use_numpy):
+                sizes = []
+
+                def counting(*args, **kwargs):
+                    for block in original(*args, **kwargs):
+                        sizes.append(len(block))
+                        yield block
+
+                with mock.patch.object(png, 'decompress', counting):
+                    _, _, got, _ = png.Reader(bytes=data).read_region(
+                        3, 0, 13, 2)
+                    got = [list(row) for row in got]
+                self.assertEqual(got, [row[3:13] for row in rows[:2]])
+                self.assertLessEqual(
+                    sum(sizes), (2 + png.DECOMPRESS_ROWS) * (width + 1))
+
+
+class TestIterStream(unittest.TestCase):
+    def test_pipe(self):
+        """iter_stream decodes straightlaced and interlaced images
+        that follow each other in a pipe, which cannot seek,
+        and stops at the end of the pipe."""
+
+        images = [make_png(17, 9), make_png(40, 30, interlace=True),
+                  make_png(5, 4), make_png(13, 11, interlace=True)]
+        stream = b''.join(data for data, _ in images)
+        read_fd, write_fd = os.pipe()
+
+        def feed():
+            with open(write_fd, 'wb') as file:
+                file.write(stream)
+
+        # The pipe holds less than the whole stream,
+        # so it is written on another thread.
+        feeder = threading.Thread(target=feed)
+        feeder.start()
+        try:
+            with io.FileIO(read_fd, 'rb') as file:
+                frames = list(png.iter_stream(file, mode='rows'))
+        finally:
+            feeder.join()
+        self.assertEqual(len(frames), len(images))
+        for (width, height, rows, info), (_, expected) in zip(
+                frames, images):
+            self.assertEqual((width, height),
+                             (len(expected[0]), len(expected)))
+            self.assertEqual([list(row) for row in rows], expected)
+        self.assertEqual([info['interlace'] for _, _, _, info in frames],
+                         [0, 1, 0, 1])
+
+    def test_truncated(self):
+        """A stream that ends part way through an image fails,
+        rather than ending quietly."""
+
+        data, _ = make_png(17, 9)
+        stream = io.BytesIO(data + data[:20])
+        frames = png.iter_stream(stream, mode='rows')
+        next(frames)
+        with self.assertRaises(png.FormatError):
+            next(frames)
+
+
+class TestReadPasses(unittest.TestCase):
+    def write(self, width, height, planes, bitdepth, interlace=True):
+        rows = formula_rows(width, height, planes, bitdepth)
+        out = io.BytesIO()
+        png.Writer(width, height, greyscale=planes == 1,
+                   alpha=planes == 4, bitdepth=bitdepth,
+                   interlace=interlace).write(out, rows)
+        return out.getvalue(), rows
+
+    def test_matches_read_scale(self):
+        """Each reduced image is what read(scale=...) gives."""
+
+        for (width, height), planes, bitdepth, use_numpy in itertools.product(
+                ((1, 1), (3, 2), (9, 17), (40, 30)), (1, 3, 4), (8, 16),
+                (True, False)):
+            with self.subTest(size=(width, height), planes=planes,
+                              bitdepth=bitdepth, numpy=use_numpy), \
+                    numpy_used(use_numpy):
+                data, rows = self.write(width, height, planes, bitdepth)
+                passes = list(png.Reader(bytes=data).read_passes())
+                self.assertEqual([info['scale'] for _, _, _, info in passes],
+                                 [8, 4, 2, 1])
+                for got_width, got_height, got, info in passes:
+                    scale = info['scale']
+                    expected_width, expected_height, expected, _ = \
+                        png.Reader(bytes=data).read(scale=scale)
+                    self.assertEqual((got_width, got_height),
+                                     (expected_width, expected_height))
+                    self.assertEqual([list(row) for row in got],
+                                     [list(row) for row in expected])
+                self.assertEqual([list(row) for row in passes[-1][2]], rows)
+
+    def test_straightlaced(self):
+        data, rows = self.write(9, 17, 3, 8, interlace=False)
+        passes = list(png.Reader(bytes=data).read_passes())
+        self.assertEqual(len(passes), 1)
+        self.assertEqual(passes[0][3]['scale'], 1)
+        self.assertEqual([list(row) for row in passes[0][2]], rows)
+
+    def test_stops_early(self):
+        """Abandoning the iteration after the first image
+        leaves most of the data still compressed."""
+
+        data, _ = self.write(200, 200, 1, 8)
+        original = png.decompress
+        for use_numpy in (True, False):
+            with self.subTest(numpy=use_numpy), numpy_used(use_numpy):
+                sizes = []
+
+                def counting(*args, **kwargs):
+                    for block in original(*args, **kwargs):
+                        sizes.append(len(block))
+                        yield block
+
+                with mock.patch.object(png, 'decompress', counting):
+                    passes = png.Reader(bytes=data).read_passes()
+                    width, height, _, _ = next(passes)
+                    passes.close()
+                self.assertEqual((width, height), (25, 25))
+                # Pass 1 is 1/64 of the pixels.
+                self.assertLess(sum(sizes), 200 * 201 // 8)
+
+
+def reduce_rows(rows, planes, scale, average):
+    """Reduce `rows` by `scale`, as :meth:`png.Reader.read` does:
+    by keeping every `scale`-th pixel across and down,
+    or, if `average` is true, by the rounded mean of each block
+    (which is smaller on the right and bottom edges)."""
+
+    height = len(rows)
+    width = len(rows[0]) // planes
+    result = []
+    for y in range(0, height, scale):
+        row = []
+        for x in range(0, width, scale):
+            for i in range(planes):
+                if not average:
+                    row.append(rows[y][x * planes + i])
+                    continue
+                block = [rows[v][u * planes + i]
+                         for v in range(y, min(y + scale, height))
+                         for u in range(x, min(x + scale, width))]
+                row.append((sum(block) + len(block) // 2) // len(block))
+        result.append(row)
+    return result
+
+
+class TestReadScale(unittest.TestCase):
+    def write(self, width, height, planes, bitdepth, interlace=False):
+        rows = formula_rows(width, height, planes, bitdepth)
+        out = io.BytesIO()
+        png.Writer(width, height, greyscale=planes == 1,
+                   bitdepth=bitdepth, interlace=interlace).write(out, rows)
+        return out.getvalue(), rows
+
+    def test_read(self):
+        """read(scale=...) against a reference computed from read();
+        13 by 11 pixels leaves partial blocks on the right and
+        bottom edges for every scale."""
+
+        for (planes, bitdepth), interlace, use_numpy in itertools.product(
+                ((1, 2), (1, 8), (1, 16), (3, 8), (3, 16)), (False, True),
+                (True, False)):
+            data, rows = self.write(13, 11, planes, bitdepth, interlace)
+            for scale, average in itertools.product(
+                    (1, 2, 3, 4, 5, 16), (False, True)):
+                with self.subTest(planes=planes, bitdepth=bitdepth,
+                                  interlace=interlace, numpy=use_numpy,
+                                  scale=scale, average=average), \
+                        numpy_used(use_numpy):
+                    expected = reduce_rows(rows, planes, scale, average)
+                    width, height, got, info = png.Reader(bytes=data).read(
+                        scale=scale, average=average)
+                    self.assertEqual((width, height),
+                                     (len(expected[0]) // planes,
+                                      len(expected)))
+                    self.assertEqual(info['size'], (width, height))
+                    self.assertEqual([list(row) for row in got], expected)
+
+    def test_read_luma(self):
+        """read_luma(scale=...) is the luma of the reduced image."""
+
+        for bitdepth, use_numpy in itertools.product(
+                (8, 16), (True, False)):
+            data, rows = self.write(13, 11, 3, bitdepth)
+            for scale, average in itertools.product(
+                    (2, 3, 5), (False, True)):
+                with self.subTest(bitdepth=bitdepth, numpy=use_numpy,
+                                  scale=scale, average=average), \
+                        numpy_used(use_numpy):
+                    reduced = reduce_rows(rows, 3, scale, average)
+                    width, height = len(reduced[0]) // 3, len(reduced)
+                    out = io.BytesIO()
+                    png.Writer(width, height, greyscale=False,
+                               bitdepth=bitdepth).write(out, reduced)
+                    expected = png.Reader(bytes=out.getvalue()).read_luma()
+                    got = png.Reader(bytes=data).read_luma(
+                        scale=scale, average=average)
+                    self.assertEqual(got[:2], (width, height))
+                    self.assertEqual(list(got[2]), list(expected[2]))
+
+
+class TestZeroCopy(unittest.TestCase):
+    def test_close(self):
+        """A zero-copy Reader of a file releases the memory map
+        when it is closed, on leaving the ``with`` block."""
+
+        data, rows = make_png(17, 9)
+        with tempfile.TemporaryDirectory() as directory:
+            path = pathlib.Path(directory) / 'image.png'
+            path.write_bytes(data)
+            with png.Reader(filename=str(path), zero_copy=True) as reader:
+                _, _, got, _ = reader.read()
+                self.assertEqual([list(row) for row in got], rows)
+            self.assertTrue(reader.file.source.closed)
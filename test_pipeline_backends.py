@@ -0,0 +1,239 @@
+# these tests check that every backend of the detection pipeline (see PIPELINE_BACKEND in
+# CS373LicensePlateDetection.py) detects the same license plate bounding box in each of the example images, and
+# that the stages the pipeline uses agree with the reference functions they replaced
+# run them with: python -m pytest test_pipeline_backends.py
+
+import functools
+import io
+import math
+import os
+import random
+import threading
+from pathlib import Path
+
+import pytest
+
+import CS373LicensePlateDetection as detection
+from imageIO import png
+
+# the bounding boxes (min_x, min_y, max_x, max_y) that the list based pipeline detects in the example images
+EXPECTED_BOUNDING_BOXES = {
+    "numberplate1.png": (305, 246, 467, 280),
+    "numberplate2.png": (584, 299, 636, 316),
+    "numberplate3.png": (896, 341, 922, 350),
+    "numberplate4.png": (642, 271, 747, 296),
+    "numberplate5.png": (156, 382, 289, 410),
+    "numberplate6.png": (253, 197, 438, 243),
+}
+
+BACKENDS = ["lists", "bits", pytest.param("numpy", marks=pytest.mark.skipif(
+    detection.numpy is None, reason="the numpy backend needs numpy to be installed"))]
+
+
+@functools.lru_cache(maxsize=None)
+def readGreyscale(input_filename):
+    (image_width, image_height, px_array_greyscale) = detection.readRGBImageToGreyscalePixelArray(
+        str(Path(__file__).parent / input_filename))
+    return (image_width, image_height, px_array_greyscale)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+@pytest.mark.parametrize("input_filename", sorted(EXPECTED_BOUNDING_BOXES))
+def test_backend_detects_expected_bounding_box(input_filename, backend):
+    (image_width, image_height, px_array_greyscale) = readGreyscale(input_filename)
+    # the pipeline may change the pixel array it is given, so each backend gets its own copy
+    px_array_greyscale = [list(pixel_row) for pixel_row in px_array_greyscale]
+    bbox = detection.detectLicensePlate(px_array_greyscale, image_width, image_height, backend=backend)
+    assert bbox == EXPECTED_BOUNDING_BOXES[input_filename]
+
+
+def randomPixelArray(image_width, image_height, seed):
+    generator = random.Random(seed)
+    return [[generator.randrange(256) for col in range(image_width)] for row in range(image_height)]
+
+
+# the summed-area tables with a 3x3 window and stride 2 sample the same 9 pixels as the reference
+# computeStandardDeviationImage5x5 (and computeStandardDeviationImage5x5Numpy); the values can differ in the last bits,
+# as the reference computes the variance with floats
+@pytest.mark.parametrize("seed", range(5))
+def test_summed_area_standard_deviation_matches_reference(seed):
+    (image_width, image_height) = (23, 17)
+    px_array = randomPixelArray(image_width, image_height, seed)
+    reference = detection.computeStandardDeviationImage5x5(px_array, image_width, image_height)
+    out_pixel = detection.computeWindowedStandardDeviation(px_array, image_width, image_height, 3, 2)
+    for row in range(image_height):
+        assert out_pixel[row] == pytest.approx(reference[row], abs=1e-9)
+    if detection.numpy is not None:
+        reference_numpy = detection.computeStandardDeviationImage5x5Numpy(px_array, image_width, image_height)
+        out_pixel_numpy = detection.computeWindowedStandardDeviationNumpy(px_array, image_width, image_height, 3, 2)
+        assert detection.numpy.allclose(reference_numpy, reference, rtol=0, atol=1e-9)
+        assert detection.numpy.array_equal(out_pixel_numpy, detection.numpy.array(out_pixel))
+
+
+# the mean is only computed on request, by computeWindowedMeanAndStandardDeviation, from the same tables
+@pytest.mark.parametrize("seed", range(3))
+def test_windowed_mean_matches_reference(seed):
+    (image_width, image_height) = (23, 17)
+    px_array = randomPixelArray(image_width, image_height, seed)
+    (mean_pixel, out_pixel) = detection.computeWindowedMeanAndStandardDeviation(px_array, image_width, image_height, 3, 2)
+    assert out_pixel == detection.computeWindowedStandardDeviation(px_array, image_width, image_height, 3, 2)
+    for row in range(image_height):
+        for col in range(image_width):
+            if 2 <= row < image_height - 2 and 2 <= col < image_width - 2:
+                samples = [px_array[row + i][col + j] for i in (-2, 0, 2) for j in (-2, 0, 2)]
+                assert mean_pixel[row][col] == pytest.approx(sum(samples) / 9)
+            else:
+                assert mean_pixel[row][col] == 0
+    if detection.numpy is not None:
+        (mean_pixel_numpy, out_pixel_numpy) = detection.computeWindowedMeanAndStandardDeviationNumpy(
+            px_array, image_width, image_height, 3, 2)
+        assert detection.numpy.array_equal(mean_pixel_numpy, detection.numpy.array(mean_pixel))
+        assert detection.numpy.array_equal(out_pixel_numpy, detection.numpy.array(out_pixel))
+
+
+# the standard deviation of the dense window_size x window_size window around each pixel, computed directly, and 0 where
+# the window does not fit inside the image
+def bruteForceStandardDeviation(px_array, image_width, image_height, window_size):
+    reach = window_size // 2
+    out_pixel = [[0.0] * image_width for row in range(image_height)]
+    for row in range(reach, image_height - reach):
+        for col in range(reach, image_width - reach):
+            samples = [px_array[row + i][col + j] for i in range(-reach, reach + 1) for j in range(-reach, reach + 1)]
+            mean = sum(samples) / len(samples)
+            out_pixel[row][col] = math.sqrt(sum((sample - mean) ** 2 for sample in samples) / len(samples))
+    return out_pixel
+
+
+MULTI_SCALE_WINDOW_SIZES = [3, 5, 9, 15]
+MULTI_SCALE_WEIGHTS = [0.4, 0.3, 0.2, 0.1]
+
+
+@pytest.mark.parametrize("seed", range(2))
+def test_multi_scale_standard_deviation_matches_brute_force(seed):
+    (image_width, image_height) = (29, 21)
+    px_array = randomPixelArray(image_width, image_height, seed)
+    references = [bruteForceStandardDeviation(px_array, image_width, image_height, window_size)
+                  for window_size in MULTI_SCALE_WINDOW_SIZES]
+    out_pixels = detection.computeMultiScaleStandardDeviation(px_array, image_width, image_height, MULTI_SCALE_WINDOW_SIZES)
+    assert len(out_pixels) == len(references)
+    for (out_pixel, reference) in zip(out_pixels, references):
+        for row in range(image_height):
+            assert out_pixel[row] == pytest.approx(reference[row], abs=1e-9)
+
+    combined_max = detection.computeMultiScaleStandardDeviation(
+        px_array, image_width, image_height, MULTI_SCALE_WINDOW_SIZES, combine="max")
+    combined_weighted = detection.computeMultiScaleStandardDeviation(
+        px_array, image_width, image_height, MULTI_SCALE_WINDOW_SIZES, combine="weighted", weights=MULTI_SCALE_WEIGHTS)
+    for row in range(image_height):
+        for col in range(image_width):
+            values = [reference[row][col] for reference in references]
+            assert combined_max[row][col] == pytest.approx(max(values), abs=1e-9)
+            weighted = sum(weight * value for (weight, value) in zip(MULTI_SCALE_WEIGHTS, values))
+            assert combined_weighted[row][col] == pytest.approx(weighted, abs=1e-9)
+
+    if detection.numpy is not None:
+        out_pixels_numpy = detection.computeMultiScaleStandardDeviationNumpy(
+            px_array, image_width, image_height, MULTI_SCALE_WINDOW_SIZES)
+        for (out_pixel_numpy, out_pixel) in zip(out_pixels_numpy, out_pixels):
+            assert detection.numpy.array_equal(out_pixel_numpy, detection.numpy.array(out_pixel))
+        combined_max_numpy = detection.computeMultiScaleStandardDeviationNumpy(
+            px_array, image_width, image_height, MULTI_SCALE_WINDOW_SIZES, combine="max")
+        combined_weighted_numpy = detection.computeMultiScaleStandardDeviationNumpy(
+            px_array, image_width, image_height, MULTI_SCALE_WINDOW_SIZES, combine="weighted", weights=MULTI_SCALE_WEIGHTS)
+        assert detection.numpy.array_equal(combined_max_numpy, detection.numpy.array(combined_max))
+        assert detection.numpy.array_equal(combined_weighted_numpy, detection.numpy.array(combined_weighted))
+
+
+def test_multi_scale_standard_deviation_needs_a_window_size():
+    px_array = randomPixelArray(7, 5, 0)
+    with pytest.raises(ValueError):
+        detection.computeMultiScaleStandardDeviation(px_array, 7, 5, [])
+    if detection.numpy is not None:
+        with pytest.raises(ValueError):
+            detection.computeMultiScaleStandardDeviationNumpy(px_array, 7, 5, [])
+
+
+# a closing with radius 3 is three 3x3 dilations followed by three 3x3 erosions, and, like them, it gives 0 and 1
+# values, whether the thresholded image it is given holds 0 and 1 or 0 and 255
+@pytest.mark.parametrize("value", [1, 255])
+@pytest.mark.parametrize("seed", range(3))
+def test_closing_matches_repeated_3x3_dilation_and_erosion(seed, value):
+    (image_width, image_height) = (31, 19)
+    px_array = [[value if pixel >= 200 else 0 for pixel in pixel_row]
+                for pixel_row in randomPixelArray(image_width, image_height, seed)]
+    reference = px_array
+    for step in range(3):
+        reference = detection.computeDilation8Nbh3x3FlatSE(reference, image_width, image_height)
+    for step in range(3):
+        reference = detection.computeErosion8Nbh3x3FlatSE(reference, image_width, image_height)
+    assert detection.computeClosing(px_array, image_width, image_height, 3) == reference
+    binary_image = detection.computeClosingBinary(
+        detection.createBinaryImageFromPixelArray(px_array, image_width, image_height), 3)
+    assert detection.createPixelArrayFromBinaryImage(binary_image) == reference
+    if detection.numpy is not None:
+        out_pixel_numpy = detection.computeClosingNumpy(px_array, image_width, image_height, 3)
+        assert detection.numpy.array_equal(out_pixel_numpy, detection.numpy.array(reference))
+
+
+# detectLicensePlatesInStream reads PNG files that follow each other in a pipe, as a camera might write them; the
+# second frame is the same image written interlaced (the bits backend is used as it is the fastest without numpy)
+def test_stream_of_frames_from_a_pipe(capsys, monkeypatch):
+    monkeypatch.setattr(detection, "PIPELINE_BACKEND", "bits")
+    data = (Path(__file__).parent / "numberplate5.png").read_bytes()
+    (image_width, image_height, rows, info) = png.Reader(bytes=data).asDirect()
+    interlaced = io.BytesIO()
+    png.Writer(image_width, image_height, greyscale=False, interlace=True).write(interlaced, rows)
+    stream = data + interlaced.getvalue()
+
+    (read_fd, write_fd) = os.pipe()
+
+    def feed():
+        with open(write_fd, "wb") as pipe:
+            pipe.write(stream)
+
+    feeder = threading.Thread(target=feed)
+    feeder.start()
+    try:
+        with io.FileIO(read_fd, "rb") as pipe:
+            detection.detectLicensePlatesInStream(pipe)
+    finally:
+        feeder.join()
+    bbox = EXPECTED_BOUNDING_BOXES["numberplate5.png"]
+    assert capsys.readouterr().out.splitlines() == [
+        "frame {}: width=480, height=640, bbox={}".format(frame, bbox) for frame in range(2)]
+
+
+# a random mask of 0 and 1 values, with a full row, and rows whose runs start at column 0 or end at the last column
+def randomMask(image_width, image_height, seed):
+    generator = random.Random(seed)
+    density = generator.choice([0.2, 0.5, 0.8])
+    mask = [[1 if generator.random() < density else 0 for col in range(image_width)] for row in range(image_height)]
+    mask[0] = [1] * image_width
+    mask[image_height // 2][:3] = [1, 1, 0]
+    mask[image_height // 2][-3:] = [0, 1, 1]
+    mask[image_height - 1][0] = 1
+    mask[image_height - 1][image_width - 1] = 1
+    return mask
+
+
+@pytest.mark.parametrize("use_numpy", [False, pytest.param(True, marks=pytest.mark.skipif(
+    detection.numpy is None, reason="needs numpy"))])
+@pytest.mark.parametrize("seed", range(6))
+def test_binary_labeling_matches_reference(seed, use_numpy, monkeypatch):
+    if not use_numpy:
+        monkeypatch.setattr(detection, "numpy", None)
+    # widths either side of multiples of 8, where the rows packed by numpy need one more byte
+    (image_width, image_height) = ([3, 8, 31, 63, 64, 65][seed], 19)
+    mask = randomMask(image_width, image_height, seed)
+    binary_image = detection.createBinaryImageFromPixelArray(mask, image_width, image_height)
+    assert binary_image.countPixels() == sum(map(sum, mask))
+    assert [[binary_image.getPixel(col, row) for col in range(image_width)] for row in range(image_height)] == mask
+    assert detection.createPixelArrayFromBinaryImage(binary_image) == mask
+    assert detection.createPixelArrayFromBinaryImage(binary_image, 255) == [
+        [255 * value for value in pixel_row] for pixel_row in mask]
+
+    (labels, dic) = detection.computeConnectedComponentLabelingBinary(binary_image)
+    (reference, reference_dic) = detection.computeConnectedComponentLabeling(
+        [list(pixel_row) for pixel_row in mask], image_width, image_height)
+    assert labels == reference
+    assert dic == reference_dic